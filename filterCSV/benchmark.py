@@ -0,0 +1,186 @@
+#python3
+################################################################################
+# File: benchmark.py
+# Author: Nate Lao (lao.nathan@yahoo.com)
+# Description:
+#	Benchmark suite for filterCSV.py. Generates synthetic transaction CSVs in
+#   the "Transaction Description" layout with a configurable number of rows
+#   and keyword density, times DataTable.importFile, filterOut and exportFile
+#   for each keyword count and matching method, records the memory peak of the
+#   whole import/filter/export run and stores the results as JSON so that runs
+#   can be compared against a baseline.
+#
+#   Keywords contain digits and the other description words only letters, so
+#   a row matches exactly when a keyword was put into it: the keyword density
+#   is the fraction of remainder rows.
+#
+# Usage:
+#     benchmark.py [--rows N ...] [--keywords K ...] [--density D]
+#                  [--methods METHOD ...] [--seed S] [--output FILE]
+#                  [--baseline FILE] [--tolerance T]
+################################################################################
+
+import argparse
+import csv
+import io
+import json
+import platform
+import random
+import string
+import tracemalloc
+
+from filterCSV import DataTable
+from keywordMatcher import KeywordMatcher, METHODS
+from runStats import RunStats
+
+HEADERS = ["Transaction Date","Transaction Description","Amount"]
+DESCRIPTION_HEADER = "Transaction Description"
+
+# Returns <count> distinct keywords, such as "market0042"
+def generateKeywords(count,rng):
+	stems = ["market","grocery","airline","hotel","electric","water","cafe","store","fuel","pharmacy"]
+	return ["%s%04d" % (rng.choice(stems),index) for index in range(count)]
+
+# Returns a random description word made of letters only, so it can never
+# contain a keyword
+def randomWord(rng):
+	return "".join(rng.choice(string.ascii_letters) for _ in range(rng.randint(3,10)))
+
+# Returns the (headers,rows) of a synthetic statement of <numRows> rows. Each
+# row's description contains one of the <keywords> with probability
+# <density>, in any case, at a random position among 2 to 6 random words.
+def generateTransactions(numRows,keywords,density,rng):
+	vocabulary = [randomWord(rng).upper() for _ in range(1000)]
+	rows = []
+	for index in range(numRows):
+		words = [rng.choice(vocabulary) for _ in range(rng.randint(2,6))]
+		if (len(keywords) > 0 and rng.random() < density):
+			keyword = rng.choice(keywords)
+			words.insert(rng.randint(0,len(words)),keyword.upper() if rng.random() < 0.5 else keyword)
+		date = "%02d/%02d/2020" % (rng.randint(1,12),rng.randint(1,28))
+		amount = "%.2f" % rng.uniform(1,500)
+		rows += [[date," ".join(words),amount]]
+	return (HEADERS,rows)
+
+# Returns the generated statement as csv text
+def toCSV(headers,rows):
+	text = io.StringIO()
+	outFile = csv.writer(text)
+	outFile.writerow(headers)
+	outFile.writerows(rows)
+	return text.getvalue()
+
+# Metrics compared against a baseline, all of which regress when they grow
+COMPARED = ["compile_s","import_s","filter_s","export_s","pipeline_peak_bytes"]
+
+# Imports <text>, filters it with <matcher> and exports both tables, the same
+# steps as a default filterCSV.py run
+def runPipeline(text,matcher):
+	dataTable = DataTable()
+	dataTable.importFile(io.StringIO(text,newline=""))
+	filteredTable,remainderTable = dataTable.filterOut(DESCRIPTION_HEADER,matcher)
+	filteredTable.exportFile(io.StringIO(newline=""))
+	remainderTable.exportFile(io.StringIO(newline=""))
+	return (filteredTable,remainderTable)
+
+# Runs every benchmark on one statement and returns a dict of metric name to
+# value. Times are in seconds, memory in bytes.
+def benchCase(numRows,numKeywords,density,method,rng):
+	keywords = generateKeywords(numKeywords,rng)
+	headers,rows = generateTransactions(numRows,keywords,density,rng)
+	text = toCSV(headers,rows)
+	result = {"rows": numRows,"keywords": numKeywords,"input_size": len(text)}
+
+	# Stages are timed around the plain DataTable calls: passing the
+	# RunStats to them would time the per-keyword hit counting as well
+	stats = RunStats()
+	with stats.stage("compile"):
+		matcher = KeywordMatcher(keywords,method)
+	dataTable = DataTable()
+	with stats.stage("import") as stage:
+		dataTable.importFile(io.StringIO(text,newline=""))
+		stage.update(numRows,len(text))
+	with stats.stage("filter") as stage:
+		filteredTable,remainderTable = dataTable.filterOut(DESCRIPTION_HEADER,matcher)
+		stage.update(numRows)
+	with stats.stage("export") as stage:
+		filteredTable.exportFile(stage.writer(io.StringIO(newline="")))
+		remainderTable.exportFile(stage.writer(io.StringIO(newline="")))
+		stage.update(numRows)
+
+	for stageReport in stats.report()["stages"]:
+		result["%s_s" % stageReport["name"]] = stageReport["seconds"]
+	result["remainder_rows"] = len(remainderTable.data)
+	result["filter_rows_per_sec"] = numRows / result["filter_s"] if result["filter_s"] > 0 else None
+
+	# Memory peak is measured on a separate run, since tracemalloc slows
+	# allocation down
+	tracemalloc.start()
+	runPipeline(text,matcher)
+	result["pipeline_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return result
+
+# Prints the ratio of each COMPARED metric to the baseline and returns the
+# list of metrics that are slower (or bigger) than the baseline by more than
+# <tolerance>. maths/bigraph_bench.py does the same for graphs, but the
+# script directories do not import from each other, so the check is kept
+# here for filterCSV's own metrics.
+def compare(results,baseline,tolerance):
+	regressions = []
+	for (key,metrics) in sorted(results.items()):
+		if (key not in baseline["results"]):
+			print("%-32s no baseline" % key)
+			continue
+		for metric in COMPARED:
+			value = metrics.get(metric)
+			old = baseline["results"][key].get(metric)
+			if (value is None or not old):
+				continue
+			ratio = value / old
+			flag = ""
+			if (ratio > 1 + tolerance):
+				flag = "  REGRESSION"
+				regressions += ["%s %s" % (key,metric)]
+			print("%-32s %-20s %12.6g -> %12.6g  x%.2f%s" % (key,metric,old,value,ratio,flag))
+	return regressions
+
+if __name__ == "__main__":
+	argParser = argparse.ArgumentParser(description="Benchmark filterCSV.py import, filtering and export.")
+	argParser.add_argument("--rows",type=int,nargs="+",default=[100000],help="number of rows per statement")
+	argParser.add_argument("--keywords",type=int,nargs="+",default=[3,100,1000,10000],help="keyword counts to filter with")
+	argParser.add_argument("--density",type=float,default=0.1,help="fraction of rows that contain a keyword")
+	argParser.add_argument("--methods",nargs="+",choices=METHODS,default=METHODS,help="keyword matching methods")
+	argParser.add_argument("--seed",type=int,default=0,help="random seed for the statements")
+	argParser.add_argument("--output",help="JSON file to write the results to")
+	argParser.add_argument("--baseline",help="JSON results of an earlier run to compare against")
+	argParser.add_argument("--tolerance",type=float,default=0.10,help="relative slowdown reported as a regression")
+	args = argParser.parse_args()
+
+	results = {}
+	for method in args.methods:
+		for numRows in args.rows:
+			for numKeywords in args.keywords:
+				key = "%s-%drows-%dkw" % (method,numRows,numKeywords)
+				print("running %s" % key)
+				results[key] = benchCase(numRows,numKeywords,args.density,method,random.Random(args.seed))
+				print(json.dumps(results[key],sort_keys=True))
+
+	report = {
+		"python": platform.python_version(),
+		"machine": platform.machine(),
+		"density": args.density,
+		"seed": args.seed,
+		"results": results,
+	}
+	if (args.output):
+		with open(args.output,"w") as outFile:
+			json.dump(report,outFile,indent=2,sort_keys=True)
+
+	if (args.baseline):
+		with open(args.baseline) as baselineFile:
+			baseline = json.load(baselineFile)
+		regressions = compare(results,baseline,args.tolerance)
+		if (regressions):
+			print("%d regression(s) over %.0f%%" % (len(regressions),args.tolerance * 100))
+			raise SystemExit(1)
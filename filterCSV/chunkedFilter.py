@@ -0,0 +1,165 @@
+#python3
+################################################################################
+# File: chunkedFilter.py
+# Author: Nate Lao (lao.nathan@yahoo.com)
+# Description:
+#	Parallel version of filterCSV.filterStream. The input file is split into
+#   byte ranges that each end on a row boundary, every range is filtered in a
+#   process pool with the same semantics as filterOut, and the filtered and
+#   remainder outputs are stitched back together in the original row order.
+#
+#   Row boundaries are found by tracking the parity of the quote characters:
+#   a newline only ends a row when it is outside of a quoted field, i.e. when
+#   an even number of quotes precedes it. Escaped quotes ("") do not change
+#   the parity. This relies on quotes and newlines being single bytes that
+#   never appear inside multi-byte characters, which holds for ASCII, UTF-8
+#   and the single-byte encodings, but not for UTF-16.
+################################################################################
+
+import concurrent.futures
+import csv
+import io
+import locale
+import os
+import shutil
+import tempfile
+
+from keywordMatcher import KeywordMatcher, columnIndex, filterRows
+
+# Block size used when scanning the input for row boundaries
+SCAN_BLOCK = 1 << 20
+
+# Returns the byte offsets of the row boundaries of the file at <path> closest
+# after each of the <targets> offsets (which must be sorted). A boundary is the
+# offset just past a newline that is not inside a quoted field, or the file
+# size. The file is scanned once, in blocks.
+def findRowBoundaries(path,targets):
+	size = os.path.getsize(path)
+	boundaries = []
+	pending = list(targets)
+	pos = 0 # file offset of the start of the current block
+	inQuotes = False
+	with open(path,"rb") as file:
+		while (pending):
+			block = file.read(SCAN_BLOCK)
+			if (not block):
+				break
+			blockEnd = pos + len(block)
+			scanFrom = 0
+			while (pending and pending[0] < blockEnd):
+				# Carry the quote parity up to the target, then look for the
+				# first newline outside of quotes from there
+				start = max(pending[0] - pos,scanFrom)
+				inQuotes ^= (block.count(b'"',scanFrom,start) & 1) == 1
+				scanFrom = start
+				newline = findUnquotedNewline(block,scanFrom,inQuotes)
+				if (newline < 0):
+					break
+				inQuotes ^= (block.count(b'"',scanFrom,newline) & 1) == 1
+				scanFrom = newline + 1
+				boundary = pos + scanFrom
+				while (pending and pending[0] <= boundary):
+					pending.pop(0)
+				boundaries.append(boundary)
+			inQuotes ^= (block.count(b'"',scanFrom) & 1) == 1
+			pos = blockEnd
+	boundaries += [size] * len(pending)
+	return boundaries
+
+# Returns the index of the first newline in <block> at or after <start> that is
+# outside of quotes, given whether <start> is inside quotes, or -1.
+def findUnquotedNewline(block,start,inQuotes):
+	while (True):
+		newline = block.find(b"\n",start)
+		if (newline < 0):
+			return -1
+		inQuotes ^= (block.count(b'"',start,newline) & 1) == 1
+		if (not inQuotes):
+			return newline
+		start = newline + 1
+
+# Returns the header row of the csv file at <path> and the byte offset where
+# the data rows start.
+def readHeaders(path,encoding):
+	headerEnd = findRowBoundaries(path,[0])[0]
+	with open(path,"rb") as file:
+		text = file.read(headerEnd).decode(encoding)
+	headers = next(csv.reader(io.StringIO(text,newline="")),[])
+	return (headers,headerEnd)
+
+# Splits the data rows of the file at <path>, starting at byte <dataStart>,
+# into at most <numChunks> (start,end) byte ranges of similar size that each
+# start and end on a row boundary.
+def splitChunks(path,dataStart,numChunks):
+	size = os.path.getsize(path)
+	step = max(1,(size - dataStart) // max(1,numChunks))
+	targets = list(range(dataStart + step,size,step))[:numChunks - 1]
+	edges = [dataStart]
+	for boundary in findRowBoundaries(path,targets):
+		if (boundary > edges[-1]):
+			edges.append(boundary)
+	if (edges[-1] < size):
+		edges.append(size)
+	return list(zip(edges[:-1],edges[1:]))
+
+# Process pool worker. Filters the rows in bytes [start,end) of the file at
+# <path> and writes them to two temporary csv files in <tmpDir>.
+# Returns a tuple of the (filteredPath,remainderPath,numFiltered,numRemainder).
+def filterChunk(path,start,end,colIdx,matcher,encoding,tmpDir):
+	with open(path,"rb") as file:
+		file.seek(start)
+		text = file.read(end - start).decode(encoding)
+
+	paths = []
+	files = []
+	for suffix in (".filtered.csv",".remainder.csv"):
+		(fd,tmpPath) = tempfile.mkstemp(suffix=suffix,dir=tmpDir)
+		paths.append(tmpPath)
+		files.append(open(fd,"w",newline="",encoding=encoding))
+
+	filteredOut = csv.writer(files[0])
+	remainderOut = csv.writer(files[1])
+	numFiltered,numRemainder = filterRows(csv.reader(io.StringIO(text,newline="")),colIdx,matcher,filteredOut,remainderOut)
+
+	for file in files:
+		file.close()
+	return (paths[0],paths[1],numFiltered,numRemainder)
+
+# Parallel filterStream over the csv file at <inputPath>: rows that do not
+# contain any keyword go to <filteredPath>, rows that do to <remainderPath>,
+# in the same order and format as filterStream. <matcher> is a KeywordMatcher,
+# <processes> the pool size (default: number of cores) and <chunksPerProcess>
+# how many chunks each process gets, to even out the load.
+# Returns a tuple of the (headers,numFiltered,numRemainder).
+def filterParallel(inputPath,filteredPath,remainderPath,headerName,matcher,processes=None,chunksPerProcess=4,encoding=None):
+	if (encoding is None):
+		encoding = locale.getpreferredencoding(False)
+	if (processes is None):
+		processes = os.cpu_count() or 1
+	if (not isinstance(matcher,KeywordMatcher)):
+		matcher = KeywordMatcher(matcher)
+
+	(headers,dataStart) = readHeaders(inputPath,encoding)
+	colIdx = columnIndex(headers,headerName)
+	chunks = splitChunks(inputPath,dataStart,processes * chunksPerProcess)
+
+	# Keep the temporary chunk outputs next to the final outputs, so the merge
+	# does not cross file systems
+	tmpDir = os.path.dirname(os.path.abspath(filteredPath))
+	with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+		futures = [pool.submit(filterChunk,inputPath,start,end,colIdx,matcher,encoding,tmpDir) for (start,end) in chunks]
+		results = [future.result() for future in futures]
+
+	numFiltered = 0
+	numRemainder = 0
+	with open(filteredPath,"w",newline="",encoding=encoding) as filteredFile, open(remainderPath,"w",newline="",encoding=encoding) as remainderFile:
+		csv.writer(filteredFile).writerow(headers)
+		csv.writer(remainderFile).writerow(headers)
+		for (filteredPart,remainderPart,chunkFiltered,chunkRemainder) in results:
+			for (part,outFile) in ((filteredPart,filteredFile),(remainderPart,remainderFile)):
+				with open(part,newline="",encoding=encoding) as partFile:
+					shutil.copyfileobj(partFile,outFile)
+				os.remove(part)
+			numFiltered += chunkFiltered
+			numRemainder += chunkRemainder
+	return (headers,numFiltered,numRemainder)
@@ -0,0 +1,109 @@
+#python3
+################################################################################
+# File: columnTable.py
+# Author: Nate Lao (lao.nathan@yahoo.com)
+# Description:
+#	Columnar, typed representation of a filterCSV.DataTable for repeated
+#   summaries. Each column is stored as its own list, headers are looked up
+#   through a dict, and numeric columns are parsed into an array('d') the
+#   first time they are aggregated and reused afterwards, so summaries over a
+#   large statement do not re-parse every row.
+#
+#   If NumPy is installed, numericColumn arrays can be viewed as NumPy arrays
+#   without a copy through asNumpy.
+################################################################################
+
+from array import array
+
+from keywordMatcher import KeywordMatcher
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+class ColumnTable:
+	# Builds the columns from a list of <headers> and a list of <rows>. Rows
+	# shorter than the headers are padded with empty strings.
+	def __init__(self,headers,rows):
+		self.headers = list(headers)
+		numCols = len(self.headers)
+		rows = [row if len(row) >= numCols else list(row) + [""] * (numCols - len(row)) for row in rows]
+		self.columns = [[row[colIdx] for row in rows] for colIdx in range(numCols)]
+		self.numRows = len(rows)
+
+		# Same semantics as DataTable.getColumnIndex: the last matching header
+		self.headerIndex = {}
+		for (index,col) in enumerate(self.headers):
+			self.headerIndex[col] = index
+
+		# Parsed numeric columns, by column index
+		self.numericCache = {}
+
+	# Returns the index of the column that matches the <headerName>.
+	# Returns -1 if could not be found.
+	def getColumnIndex(self,headerName):
+		return self.headerIndex.get(headerName,-1)
+
+	# Returns the list of string values of the column at <headerName>
+	def column(self,headerName):
+		colIdx = self.getColumnIndex(headerName)
+		if (colIdx < 0):
+			raise KeyError("no column named %s" % headerName)
+		return self.columns[colIdx]
+
+	# Returns the column at <headerName> as an array('d'), parsing it the
+	# first time. Raises ValueError if a value is not a number.
+	def numericColumn(self,headerName):
+		colIdx = self.getColumnIndex(headerName)
+		if (colIdx < 0):
+			raise KeyError("no column named %s" % headerName)
+		if (colIdx not in self.numericCache):
+			self.numericCache[colIdx] = array("d",map(float,self.columns[colIdx]))
+		return self.numericCache[colIdx]
+
+	# Returns the numeric column at <headerName> as a NumPy array sharing the
+	# array('d') buffer
+	def asNumpy(self,headerName):
+		if (np is None):
+			raise ImportError("asNumpy requires numpy")
+		return np.frombuffer(self.numericColumn(headerName),dtype=np.float64)
+
+	# Aggregates over the numeric column at <headerName>. min, max and mean
+	# return None for an empty table.
+	def sum(self,headerName):
+		return sum(self.numericColumn(headerName))
+
+	def min(self,headerName):
+		values = self.numericColumn(headerName)
+		return min(values) if len(values) > 0 else None
+
+	def max(self,headerName):
+		values = self.numericColumn(headerName)
+		return max(values) if len(values) > 0 else None
+
+	def mean(self,headerName):
+		values = self.numericColumn(headerName)
+		return sum(values) / len(values) if len(values) > 0 else None
+
+	# Returns a dict of the total of the numeric column <valueHeader> for the
+	# rows whose <keyHeader> column contains each keyword of <keywordList>
+	# (a list of keywords or a KeywordMatcher). A row counts towards the
+	# first keyword found in it only, so totals never count a row twice.
+	# Keys are the keywords as matched (lowercased unless case-sensitive);
+	# rows matching no keyword are totalled under None.
+	def groupByKeyword(self,keyHeader,valueHeader,keywordList):
+		if (isinstance(keywordList,KeywordMatcher)):
+			matcher = keywordList
+		else:
+			matcher = KeywordMatcher(keywordList)
+		totals = {}
+		for keyword in matcher.keywords:
+			totals[keyword] = 0.0
+		totals[None] = 0.0
+
+		values = self.numericColumn(valueHeader)
+		for (key,value) in zip(self.column(keyHeader),values):
+			keyword = matcher.findFirst(str(key))
+			totals[keyword] = totals.get(keyword,0.0) + value
+		return totals
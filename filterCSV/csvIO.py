@@ -0,0 +1,127 @@
+#python3
+################################################################################
+# File: csvIO.py
+# Author: Nate Lao (lao.nathan@yahoo.com)
+# Description:
+#	Opens the input and output files of filterCSV.py. Compressed inputs
+#   (gzip, xz, bzip2 and zstd, detected from their first bytes) are
+#   decompressed while they are read, outputs can be compressed while they are
+#   written, and uncompressed inputs can be read through mmap instead of a
+#   buffered text file.
+#
+#   zstd support needs the zstandard package; the other formats only use the
+#   standard library.
+################################################################################
+
+import bz2
+import gzip
+import io
+import locale
+import lzma
+import mmap
+
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+# Magic bytes of each supported compression format
+MAGIC = [
+	("gz",b"\x1f\x8b"),
+	("xz",b"\xfd7zXZ\x00"),
+	("bz2",b"BZh"),
+	("zst",b"\x28\xb5\x2f\xfd"),
+]
+
+COMPRESSIONS = [name for (name,magic) in MAGIC]
+
+# Returns the compression format of the file at <path> ("gz", "xz", "bz2" or
+# "zst"), or None if it is not compressed
+def detectCompression(path):
+	with open(path,"rb") as file:
+		head = file.read(8)
+	for (name,magic) in MAGIC:
+		if (head.startswith(magic)):
+			return name
+	return None
+
+def requireZstandard():
+	if (zstandard is None):
+		raise ImportError("zstd files require the zstandard package")
+
+# Opens the csv file at <path> for reading and returns a text file (or, with
+# <useMmap>, an iterable of lines) to pass to csv.reader. Compressed files are
+# decompressed on the fly; <useMmap> only applies to uncompressed files.
+def openInput(path,useMmap=False,encoding=None):
+	if (encoding is None):
+		encoding = locale.getpreferredencoding(False)
+	compression = detectCompression(path)
+	if (compression == "gz"):
+		return gzip.open(path,"rt",newline="",encoding=encoding)
+	elif (compression == "xz"):
+		return lzma.open(path,"rt",newline="",encoding=encoding)
+	elif (compression == "bz2"):
+		return bz2.open(path,"rt",newline="",encoding=encoding)
+	elif (compression == "zst"):
+		requireZstandard()
+		reader = zstandard.ZstdDecompressor().stream_reader(open(path,"rb"),closefd=True)
+		return io.TextIOWrapper(reader,newline="",encoding=encoding)
+	elif (useMmap):
+		return MmapLines(path,encoding)
+	else:
+		return open(path,newline="",encoding=encoding)
+
+# Opens <path> for writing csv rows, compressed with <compression> (one of
+# COMPRESSIONS) or uncompressed if None
+def openOutput(path,compression=None,encoding=None):
+	if (encoding is None):
+		encoding = locale.getpreferredencoding(False)
+	if (compression is None):
+		return open(path,"w",newline="",encoding=encoding)
+	elif (compression == "gz"):
+		return gzip.open(path,"wt",newline="",encoding=encoding)
+	elif (compression == "xz"):
+		return lzma.open(path,"wt",newline="",encoding=encoding)
+	elif (compression == "bz2"):
+		return bz2.open(path,"wt",newline="",encoding=encoding)
+	elif (compression == "zst"):
+		requireZstandard()
+		writer = zstandard.ZstdCompressor().stream_writer(open(path,"wb"),closefd=True)
+		return io.TextIOWrapper(writer,newline="",encoding=encoding)
+	else:
+		raise ValueError("unknown compression: %s" % compression)
+
+# Returns <path> with the file extension of <compression> appended
+def outputPath(path,compression=None):
+	return path if compression is None else "%s.%s" % (path,compression)
+
+# Iterable over the lines (newlines included) of a memory-mapped file. Lines
+# are sliced out of the mapping and decoded one at a time, so the file is
+# never copied through a buffered text file. Also usable as a context manager.
+class MmapLines:
+	def __init__(self,path,encoding):
+		self.encoding = encoding
+		with open(path,"rb") as file:
+			# mmap cannot map an empty file
+			self.data = mmap.mmap(file.fileno(),0,access=mmap.ACCESS_READ) if file.seek(0,2) > 0 else b""
+
+	def __iter__(self):
+		data = self.data
+		encoding = self.encoding
+		start = 0
+		end = len(data)
+		while (start < end):
+			newline = data.find(b"\n",start)
+			stop = end if newline < 0 else newline + 1
+			yield data[start:stop].decode(encoding)
+			start = stop
+
+	def close(self):
+		if (isinstance(self.data,mmap.mmap)):
+			self.data.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self,*excInfo):
+		self.close()
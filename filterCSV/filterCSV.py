@@ -10,27 +10,91 @@
 #          and classes should be taken out to their own file.
 #
 # Usage:
-#     filterCSV.py <CSV_FILE>
+#     filterCSV.py [--stream | --processes N | --categories | --incremental]
+#                  [--compress gz|xz|bz2|zst] [--mmap]
+#                  [--progress [SECONDS]] [--report JSON_FILE] <CSV_FILE>
+#
+#     --stream       filter row by row straight into the output files instead
+#                    of loading the whole table, so memory use does not grow
+#                    with the input size
+#     --processes N  split the file into chunks and filter them in parallel
+#                    over N processes (see chunkedFilter.py)
+#     --categories   route each row to the CSV of the first category in
+#                    filterParams.py that it matches, in a single pass
+#     --incremental  only filter the rows appended to CSV_FILE since the last
+#                    --incremental run and append them to the outputs (see
+#                    incrementalFilter.py)
+#     --compress     compress the output files (the extension is appended)
+#     --mmap         read an uncompressed input through mmap
+#     --progress [SECONDS]  print rows/s and MB/s of the running stage every
+#                    SECONDS (default 1) to stderr
+#     --report JSON_FILE  write stage timings, throughput, keyword hits and
+#                    peak memory to JSON_FILE (see runStats.py)
+#
+#     Compressed inputs (gzip, xz, bzip2, zstd) are decompressed on the fly,
+#     see csvIO.py.
 ################################################################################
 
+import argparse
 import csv
+import itertools
+import os
 import sys
-import re
 import filterParams as param
+from keywordMatcher import KeywordMatcher, columnIndex, valueMatches, filterRows
+import chunkedFilter
+import csvIO
+import incrementalFilter
+from runStats import RunStats
+from columnTable import ColumnTable
 
 # Utility Functions
-def stringListLowercase(strList):
-	output = []
-	for word in strList:
-		output += [word.lower()]
-	return output
+# Returns <keywordList> as a KeywordMatcher. <keywordList> may be a list of
+# keywords, compiled with the default options, or an already built matcher.
+def toMatcher(keywordList):
+	if (isinstance(keywordList,KeywordMatcher)):
+		return keywordList
+	return KeywordMatcher(keywordList)
+
+# Returns the KeywordMatcher for the keywords and options in filterParams.py
+def paramMatcher():
+	return KeywordMatcher(param.filterKeywords,param.matchMethod,param.wholeWord,param.caseSensitive)
+
+# Returns the categories in filterParams.py as routing rules, with each
+# keyword list compiled with the filterParams.py matching options
+def paramRules():
+	rules = []
+	for (name,headerName,keywordList) in param.filterCategories:
+		rules += [(name,headerName,KeywordMatcher(keywordList,param.matchMethod,param.wholeWord,param.caseSensitive))]
+	return rules
+
+# Compiles routing <rules> (a list of (name,headerName,keywordList) tuples,
+# where keywordList is a list of keywords or a KeywordMatcher) against
+# <headers>. Returns a list of (name,colIdx,matcher) tuples, in rule order.
+def compileRules(headers,rules):
+	compiled = []
+	for (name,headerName,keywordList) in rules:
+		compiled += [(name,columnIndex(headers,headerName),toMatcher(keywordList))]
+	return compiled
+
+# Returns the name of the first compiled rule that <row> matches, or None
+def matchRule(row,compiledRules):
+	for (name,colIdx,matcher) in compiledRules:
+		if (matcher.matches(str(row[colIdx]))):
+			return name
+	return None
 
 class DataTable:
 	def __init__(self):
 		self.headers = []
 		self.data = []	
 	
-	def importFile(self,file):
+	# If <stats> (a runStats.RunStats) is given, the import is recorded as
+	# an "import" stage
+	def importFile(self,file,stats=None):
+		if (stats is not None):
+			stage = stats.stage("import")
+			file = stage.lines(file)
 		list = csv.reader(file)
 		isHeaderRow = True
 		for row in list:
@@ -38,25 +102,32 @@ class DataTable:
 				self.headers = row
 			else:
 				self.data += [row] # make sure each row is self-contain in a list
+				if (stats is not None):
+					stage.update()
 			isHeaderRow = False
+		if (stats is not None):
+			stage.finish()
 	
 	# Export to csv
-	def exportFile(self,file):
-		outFile = csv.writer(file)
-		outFile.writerow(self.headers)
-		outFile.writerows(self.data)
+	# If <stats> is given, the export is recorded as an "export" stage
+	def exportFile(self,file,stats=None):
+		if (stats is None):
+			outFile = csv.writer(file)
+			outFile.writerow(self.headers)
+			outFile.writerows(self.data)
+			return
+		
+		with stats.stage("export") as stage:
+			outFile = csv.writer(stage.writer(file))
+			outFile.writerow(self.headers)
+			for row in self.data:
+				outFile.writerow(row)
+				stage.update()
 	
 	# Returns the index of the column that matches the <headerName>.
 	# Returns -1 if could not be found.
 	def getColumnIndex(self,headerName):
-		index = 0
-		output = -1
-		for col in self.headers:
-			if (col == headerName):
-				output = index
-			index += 1
-			
-		return output
+		return columnIndex(self.headers,headerName)
 	
 	
 	# Return the sum amount the data column at <headerName>
@@ -68,33 +139,41 @@ class DataTable:
 			sum += float(row[colIdx])
 		return sum
 	
+	# Returns a columnar copy of the table (see columnTable.py), for repeated
+	# aggregates over large tables
+	def toColumns(self):
+		return ColumnTable(self.headers,self.data)
+	
 	# Filter out a keyword from a specified header
+	# <keywordList> is a list of keywords or a KeywordMatcher
+	# If <stats> is given, the filtering is recorded as a "filter" stage
+	# along with the keyword hits
 	# Returns a tuple of the (filteredTable,remainderTable)
-	def filterOut(self,headerName,keywordList):
+	def filterOut(self,headerName,keywordList,stats=None):
 		filteredTable = DataTable()
 		remainderTable = DataTable()
 		filteredTable.headers = self.headers
 		remainderTable.headers = self.headers
 		filteredData = []
 		remainderData = []
-		keywordList = stringListLowercase(keywordList) # push keywords to lowercase
+		matcher = toMatcher(keywordList) # compile the keywords once
 		colIdx = self.getColumnIndex(headerName)
 		
+		stage = None if stats is None else stats.stage("filter")
+		
 		# Iterate through the input data
 		for row in self.data:
-			curString = str(row[colIdx]).lower() # pull the target column value, push to lowercase
-			containsKeyword = False
-			
-			# See if the current element contains any of the keywords
-			for keyword in keywordList:
-				containsKeyword = containsKeyword or (keyword in curString)
-			
+			curString = str(row[colIdx])
 			# If it does not contain the keyword, push into filtered data
-			if (not containsKeyword):
+			if (not valueMatches(matcher,curString,stats)):
 				filteredData += [row]
 			# If it does contain the keyword, push to remainder
 			else:
 				remainderData += [row]		
+			if (stage is not None):
+				stage.update(1,len(curString)) # bytes scanned by the matcher
+		if (stage is not None):
+			stage.finish()
 		
 		# Push data to tables
 		filteredTable.data = filteredData
@@ -102,6 +181,40 @@ class DataTable:
 		
 		return (filteredTable,remainderTable)
 	
+	# Routes every row to the first of the <rules> it matches, in one pass.
+	# <rules> is a list of (name,headerName,keywordList) tuples: a row matches
+	# a rule if its <headerName> column contains any of the keywords.
+	# Returns a tuple of the (categoryTables,remainderTable), where
+	# categoryTables maps each rule name to the table of its rows and
+	# remainderTable holds the rows that matched no rule.
+	def route(self,rules):
+		compiledRules = compileRules(self.headers,rules)
+		categoryTables = {}
+		for (name,colIdx,matcher) in compiledRules:
+			categoryTables[name] = DataTable()
+			categoryTables[name].headers = self.headers
+		remainderTable = DataTable()
+		remainderTable.headers = self.headers
+		
+		for row in self.data:
+			name = matchRule(row,compiledRules)
+			if (name is None):
+				remainderTable.data += [row]
+			else:
+				categoryTables[name].data += [row]
+		
+		return (categoryTables,remainderTable)
+	
+	# Returns a TableView of every row of the table
+	def view(self):
+		return TableView(self,bytearray(b"\x01") * len(self.data))
+	
+	# Returns a TableView of the rows whose <headerName> column contains any
+	# of the keywords (the remainder rows of filterOut). The filtered rows of
+	# filterOut are its complement, ~table.select(headerName,keywordList).
+	def select(self,headerName,keywordList):
+		return self.view().select(headerName,keywordList)
+	
 	# Return a format string for headers
 	def headersString(self):
 		delim = "|"
@@ -121,33 +234,269 @@ class DataTable:
 		output += "number of data elements:\n%d\n" % len(self.data)
 		return output
 
+# Lightweight selection of rows of a parent DataTable, stored as a mask of one
+# byte (0 or 1) per parent row instead of a copy of the rows. Views over the
+# same parent combine with & (and), | (or) and ~ (not), and further selections
+# only test the rows already selected. Rows are only copied when the view is
+# exported or materialized.
+class TableView:
+	def __init__(self,parent,mask):
+		self.parent = parent
+		self.mask = mask
+		self.headers = parent.headers
+	
+	def __len__(self):
+		return self.mask.count(1)
+	
+	# Iterates over the selected rows of the parent, in order
+	def rows(self):
+		return itertools.compress(self.parent.data,self.mask)
+	
+	# Returns the view of the selected rows whose <headerName> column
+	# contains any of the keywords
+	def select(self,headerName,keywordList):
+		matcher = toMatcher(keywordList) # compile the keywords once
+		colIdx = self.parent.getColumnIndex(headerName)
+		data = self.parent.data
+		mask = bytearray(len(data))
+		for rowIdx in itertools.compress(range(len(data)),self.mask):
+			if (matcher.matches(str(data[rowIdx][colIdx]))):
+				mask[rowIdx] = 1
+		return TableView(self.parent,mask)
+	
+	# View version of DataTable.filterOut
+	# Returns a tuple of the (filteredView,remainderView)
+	def filterOut(self,headerName,keywordList):
+		remainderView = self.select(headerName,keywordList)
+		return (self & ~remainderView,remainderView)
+	
+	# The masks are combined as big integers, so the work is done in C
+	def combine(self,other,operation):
+		if (other.parent is not self.parent):
+			raise ValueError("only views of the same DataTable can be combined")
+		length = len(self.mask)
+		value = operation(int.from_bytes(self.mask,"little"),int.from_bytes(other.mask,"little"))
+		return TableView(self.parent,bytearray(value.to_bytes(length,"little")))
+	
+	def __and__(self,other):
+		return self.combine(other,lambda a,b: a & b)
+	
+	def __or__(self,other):
+		return self.combine(other,lambda a,b: a | b)
+	
+	def __invert__(self):
+		return self.combine(self.parent.view(),lambda a,b: a ^ b)
+	
+	# Returns a new DataTable holding a copy of the selected rows
+	def materialize(self):
+		table = DataTable()
+		table.headers = self.headers
+		table.data = list(self.rows())
+		return table
+	
+	# Export to csv, same as DataTable.exportFile
+	def exportFile(self,file):
+		outFile = csv.writer(file)
+		outFile.writerow(self.headers)
+		outFile.writerows(self.rows())
+	
+	def summaryString(self):
+		output = ""
+		output += "headers:\n%s\n" % self.parent.headersString()
+		output += "number of data elements:\n%d\n" % len(self)
+		return output
+
+# Streaming version of DataTable.filterOut: reads rows from the csv <inputFile>
+# one at a time and writes each straight to <filteredFile> (rows that do not
+# contain any keyword) or <remainderFile> (rows that do), so memory use stays
+# constant no matter the input size. The header row is copied to both
+# outputs. <keywordList> is a list of keywords or a KeywordMatcher.
+# If <stats> (a runStats.RunStats) is given, the run is recorded as a single
+# "stream" stage (reading, filtering and writing are interleaved) along with
+# the keyword hits.
+# Returns a tuple of the (headers,numFiltered,numRemainder).
+def filterStream(inputFile,filteredFile,remainderFile,headerName,keywordList,stats=None):
+	stage = None
+	if (stats is not None):
+		stage = stats.stage("stream")
+		inputFile = stage.lines(inputFile)
+	reader = csv.reader(inputFile)
+	filteredOut = csv.writer(filteredFile)
+	remainderOut = csv.writer(remainderFile)
+	matcher = toMatcher(keywordList) # compile the keywords once
+	
+	headers = next(reader,[])
+	filteredOut.writerow(headers)
+	remainderOut.writerow(headers)
+	
+	colIdx = columnIndex(headers,headerName)
+	numFiltered,numRemainder = filterRows(reader,colIdx,matcher,filteredOut,remainderOut,stats,stage)
+	if (stage is not None):
+		stage.finish()
+	
+	return (headers,numFiltered,numRemainder)
+
+# Streaming version of DataTable.route: reads rows from the csv <inputFile>
+# one at a time and writes each to the file of the first rule it matches,
+# <categoryFiles> mapping each rule name to its output file, or to
+# <remainderFile> if it matches none. The header row is copied to every
+# output. If <stats> (a runStats.RunStats) is given, the run is recorded as a
+# "route" stage and each category counts as a keyword hit.
+# Returns a tuple of the (headers,categoryCounts,numRemainder).
+def routeStream(inputFile,categoryFiles,remainderFile,rules,stats=None):
+	stage = None
+	if (stats is not None):
+		stage = stats.stage("route")
+		inputFile = stage.lines(inputFile)
+	reader = csv.reader(inputFile)
+	headers = next(reader,[])
+	compiledRules = compileRules(headers,rules)
+	
+	writers = {}
+	categoryCounts = {}
+	for (name,colIdx,matcher) in compiledRules:
+		writers[name] = csv.writer(categoryFiles[name])
+		writers[name].writerow(headers)
+		categoryCounts[name] = 0
+	remainderOut = csv.writer(remainderFile)
+	remainderOut.writerow(headers)
+	
+	numRemainder = 0
+	for row in reader:
+		name = matchRule(row,compiledRules)
+		if (name is None):
+			remainderOut.writerow(row)
+			numRemainder += 1
+		else:
+			writers[name].writerow(row)
+			categoryCounts[name] += 1
+			if (stats is not None):
+				stats.hit(name)
+		if (stage is not None):
+			stage.update()
+	if (stage is not None):
+		stage.finish()
+	
+	return (headers,categoryCounts,numRemainder)
+
+# Prints the summary of a filterStream or filterParallel run
+def printStreamSummary(headers,numFiltered,numRemainder):
+	summary = DataTable()
+	summary.headers = headers
+	print("headers:\n%s\n" % summary.headersString())
+	print("number of filtered data elements:\n%d\n" % numFiltered)
+	print("number of remainder data elements:\n%d\n" % numRemainder)
+
 # Main runner
 if __name__ == "__main__":
-	# Open up files
-	print("opening %s" % sys.argv[1])
-	inputFile = open(sys.argv[1])
-	print("opening %s" % param.filteredCSV)
-	filteredFile = open(param.filteredCSV, "w+", newline='') # make sure to set newline, it will create extra empty entries
-	print("opening %s" % param.remainderCSV)
-	remainderFile = open(param.remainderCSV, "w+", newline='')
-
-	# Import data
-	print("importing %s" % inputFile)
-	dataTable = DataTable()
-	dataTable.importFile(inputFile)
-	print("INPUT TABLE")
-	print(dataTable.summaryString())
-
-	# Perform filtering
+	argParser = argparse.ArgumentParser(description="Splits a CSV file into a filtered and a remainder CSV using the keywords in filterParams.py.")
+	argParser.add_argument("csvFile",metavar="CSV_FILE",help="input CSV file, optionally gzip/xz/bzip2/zstd compressed")
+	argParser.add_argument("--stream",action="store_true",help="filter row by row in constant memory")
+	argParser.add_argument("--processes",type=int,metavar="N",help="filter chunks of the file in parallel over N processes")
+	argParser.add_argument("--categories",action="store_true",help="route rows to one CSV per category in filterParams.py")
+	argParser.add_argument("--compress",choices=csvIO.COMPRESSIONS,help="compress the output files")
+	argParser.add_argument("--mmap",action="store_true",help="read an uncompressed input through mmap")
+	argParser.add_argument("--incremental",action="store_true",help="only filter the rows appended since the last --incremental run")
+	argParser.add_argument("--progress",type=float,nargs="?",const=1.0,metavar="SECONDS",help="print a throughput line every SECONDS (default 1) to stderr")
+	argParser.add_argument("--report",metavar="JSON_FILE",help="write stage timings, throughput, keyword hits and peak memory to JSON_FILE")
+	args = argParser.parse_args()
+	stats = None
+	if (args.progress is not None or args.report):
+		stats = RunStats(args.progress)
 	descripHeader = "Transaction Description"
-	filteredTable,remainderTable = dataTable.filterOut(descripHeader,param.filterKeywords)
-	print("FILTER TABLE")
-	print(filteredTable.summaryString())
-	print("REMAINDER TABLE")
-	print(remainderTable.summaryString())
-	
-	# Output files
-	filteredTable.exportFile(filteredFile)
-	remainderTable.exportFile(remainderFile)
+	matcher = paramMatcher()
+	filteredCSV = csvIO.outputPath(param.filteredCSV,args.compress)
+	remainderCSV = csvIO.outputPath(param.remainderCSV,args.compress)
+
+	if (args.incremental):
+		# The checkpoint is a byte offset into the input and outputs are
+		# appended to, so both ends must be plain files
+		if (args.compress or csvIO.detectCompression(args.csvFile)):
+			argParser.error("--incremental only works with uncompressed input and output")
+		print("incrementally filtering %s" % args.csvFile)
+		headers,numFiltered,numRemainder,resumed = incrementalFilter.filterIncremental(args.csvFile,filteredCSV,remainderCSV,descripHeader,matcher,param.checkpointFile,stats=stats)
+		print("resumed from %s" % param.checkpointFile if resumed else "full run (no usable checkpoint)")
+		printStreamSummary(headers,numFiltered,numRemainder)
+		if (args.report):
+			stats.writeReport(args.report)
+		sys.exit(0)
+
+	if (args.processes):
+		# Chunks are byte ranges of the input, so both ends must be plain files
+		if (args.compress or csvIO.detectCompression(args.csvFile)):
+			argParser.error("--processes only works with uncompressed input and output")
+		print("filtering %s over %d processes" % (args.csvFile,args.processes))
+		stage = None if stats is None else stats.stage("parallel")
+		headers,numFiltered,numRemainder = chunkedFilter.filterParallel(args.csvFile,filteredCSV,remainderCSV,descripHeader,matcher,args.processes)
+		if (stage is not None):
+			# Keyword hits are not collected across processes
+			stage.update(numFiltered + numRemainder,os.path.getsize(args.csvFile))
+			stage.finish()
+		printStreamSummary(headers,numFiltered,numRemainder)
+		if (args.report):
+			stats.writeReport(args.report)
+		sys.exit(0)
+
+	# Open up files
+	print("opening %s" % args.csvFile)
+	inputFile = csvIO.openInput(args.csvFile,args.mmap)
+
+	if (args.categories):
+		rules = paramRules()
+		categoryFiles = {}
+		for (name,headerName,keywordList) in rules:
+			categoryCSV = csvIO.outputPath(param.categoryCSV % name,args.compress)
+			print("opening %s" % categoryCSV)
+			categoryFiles[name] = csvIO.openOutput(categoryCSV,args.compress)
+		print("opening %s" % remainderCSV)
+		remainderFile = csvIO.openOutput(remainderCSV,args.compress)
+		
+		headers,categoryCounts,numRemainder = routeStream(inputFile,categoryFiles,remainderFile,rules,stats)
+		summary = DataTable()
+		summary.headers = headers
+		print("headers:\n%s\n" % summary.headersString())
+		for (name,count) in categoryCounts.items():
+			print("number of %s data elements:\n%d\n" % (name,count))
+		print("number of remainder data elements:\n%d\n" % numRemainder)
+		
+		# Close the outputs so compressed streams are flushed
+		for outFile in categoryFiles.values():
+			outFile.close()
+		remainderFile.close()
+		if (args.report):
+			stats.writeReport(args.report)
+		sys.exit(0)
+
+	print("opening %s" % filteredCSV)
+	filteredFile = csvIO.openOutput(filteredCSV,args.compress) # opened with newline='', or it will create extra empty entries
+	print("opening %s" % remainderCSV)
+	remainderFile = csvIO.openOutput(remainderCSV,args.compress)
+
+	if (args.stream):
+		print("streaming %s" % args.csvFile)
+		headers,numFiltered,numRemainder = filterStream(inputFile,filteredFile,remainderFile,descripHeader,matcher,stats)
+		printStreamSummary(headers,numFiltered,numRemainder)
+	else:
+		# Import data
+		print("importing %s" % args.csvFile)
+		dataTable = DataTable()
+		dataTable.importFile(inputFile,stats)
+		print("INPUT TABLE")
+		print(dataTable.summaryString())
+
+		# Perform filtering
+		filteredTable,remainderTable = dataTable.filterOut(descripHeader,matcher,stats)
+		print("FILTER TABLE")
+		print(filteredTable.summaryString())
+		print("REMAINDER TABLE")
+		print(remainderTable.summaryString())
+		
+		# Output files
+		filteredTable.exportFile(filteredFile,stats)
+		remainderTable.exportFile(remainderFile,stats)
 
-	
\ No newline at end of file
+	# Close the outputs so compressed streams are flushed
+	filteredFile.close()
+	remainderFile.close()
+	if (args.report):
+		stats.writeReport(args.report)
@@ -9,5 +9,27 @@
 
 # Key words to find and filter out from the input data
 filterKeywords = ["a","b","c"]
+
+# How the keywords are matched (see keywordMatcher.py):
+# matchMethod is "regex" or "ahocorasick", wholeWord only matches keywords
+# that are not part of a longer word, caseSensitive disables lowercasing
+matchMethod = "regex"
+wholeWord = False
+caseSensitive = False
+
 filteredCSV = "filtered.csv"
-remainderCSV = "remainder.csv"
\ No newline at end of file
+remainderCSV = "remainder.csv"
+
+# Where filterCSV.py --incremental records how far the input was processed
+checkpointFile = "filterCSV.checkpoint.json"
+
+# Categories used by filterCSV.py --categories, as (name, header, keywords).
+# Each row goes to the first category whose header column contains one of its
+# keywords, written to categoryCSV % name; rows matching no category go to
+# remainderCSV.
+filterCategories = [
+	("groceries","Transaction Description",["market","grocery"]),
+	("travel","Transaction Description",["airline","hotel"]),
+	("utilities","Transaction Description",["electric","water"]),
+]
+categoryCSV = "%s.csv"
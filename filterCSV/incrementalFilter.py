@@ -0,0 +1,194 @@
+#python3
+################################################################################
+# File: incrementalFilter.py
+# Author: Nate Lao (lao.nathan@yahoo.com)
+# Description:
+#	Incremental version of filterCSV.filterStream for input files that only
+#   grow by appended rows. A JSON checkpoint records how far the input has been
+#   processed (byte offset and row count), a hash of the keyword settings, the
+#   headers and a fingerprint of the bytes just before the offset. The next run
+#   only reads the rows appended since, and appends them to the existing
+#   filtered and remainder CSVs.
+#
+#   A full rerun is done instead whenever the checkpoint does not apply: no
+#   checkpoint, different keywords/options/column, different output files,
+#   missing outputs, or an input that shrank or was rewritten before the
+#   offset. Only complete rows (followed by a newline) are processed; a row
+#   still being written at the end of the file is left for the next run.
+################################################################################
+
+import csv
+import hashlib
+import json
+import locale
+import os
+
+from chunkedFilter import SCAN_BLOCK
+from keywordMatcher import KeywordMatcher, columnIndex, filterRows
+
+# Version of the checkpoint layout
+CHECKPOINT_VERSION = 1
+
+# Number of bytes before the offset that are fingerprinted to detect rewrites
+FINGERPRINT_BYTES = 4096
+
+# Returns a hash of everything that decides which rows are filtered: the
+# column name and the keyword matcher settings
+def keywordHash(headerName,matcher):
+	settings = [headerName,matcher.method,matcher.wholeWord,matcher.caseSensitive,sorted(set(matcher.keywords))]
+	return hashlib.sha256(json.dumps(settings).encode("utf-8")).hexdigest()
+
+# Returns the sha256 of the FINGERPRINT_BYTES bytes before <offset> in <path>
+def prefixFingerprint(path,offset):
+	start = max(0,offset - FINGERPRINT_BYTES)
+	with open(path,"rb") as file:
+		file.seek(start)
+		return hashlib.sha256(file.read(offset - start)).hexdigest()
+
+# Returns the offset just past the last newline of the file at <path> that is
+# outside of quotes, scanning from <start> (which must be a row boundary), or
+# <start> if there is none. Only the last newline of each block normally needs
+# to be checked, so the scan runs at the speed of bytes.count.
+def lastRowBoundary(path,start):
+	boundary = start
+	inQuotes = False # quote parity at the start of the current block
+	pos = start
+	with open(path,"rb") as file:
+		file.seek(start)
+		while (True):
+			block = file.read(SCAN_BLOCK)
+			if (not block):
+				break
+			newline = block.rfind(b"\n")
+			while (newline >= 0):
+				if (inQuotes ^ ((block.count(b'"',0,newline) & 1) == 1)):
+					newline = block.rfind(b"\n",0,newline)
+				else:
+					boundary = pos + newline + 1
+					break
+			inQuotes ^= (block.count(b'"') & 1) == 1
+			pos += len(block)
+	return boundary
+
+# Yields the lines of the file at <path> between the byte offsets <start> and
+# <end> (both row boundaries), decoded with <encoding>
+def readLines(path,start,end,encoding):
+	with open(path,"rb") as file:
+		file.seek(start)
+		pos = start
+		while (pos < end):
+			line = file.readline(end - pos)
+			if (not line):
+				break
+			pos += len(line)
+			yield line.decode(encoding)
+
+# Loads the checkpoint at <path>, or returns None if there is none or it cannot
+# be read
+def loadCheckpoint(path):
+	if (not os.path.isfile(path)):
+		return None
+	try:
+		with open(path) as checkpointFile:
+			checkpoint = json.load(checkpointFile)
+	except (OSError,ValueError):
+		return None
+	if (checkpoint.get("version") != CHECKPOINT_VERSION):
+		return None
+	# A checkpoint is only saved once the header row was read
+	if (not checkpoint.get("headers")):
+		return None
+	return checkpoint
+
+# Writes <checkpoint> to <path>, replacing the old one atomically
+def saveCheckpoint(path,checkpoint):
+	tmpPath = path + ".tmp"
+	with open(tmpPath,"w") as checkpointFile:
+		json.dump(checkpoint,checkpointFile,indent=2,sort_keys=True)
+	os.replace(tmpPath,path)
+
+# Returns True if <checkpoint> can be resumed for this run
+def checkpointApplies(checkpoint,inputPath,filteredPath,remainderPath,keyHash):
+	if (checkpoint is None):
+		return False
+	if (checkpoint["input"] != os.path.abspath(inputPath) or checkpoint["keywordHash"] != keyHash):
+		return False
+	if (checkpoint["filtered"] != os.path.abspath(filteredPath) or checkpoint["remainder"] != os.path.abspath(remainderPath)):
+		return False
+	if (not os.path.isfile(filteredPath) or not os.path.isfile(remainderPath)):
+		return False
+	offset = checkpoint["offset"]
+	if (os.path.getsize(inputPath) < offset):
+		return False
+	return prefixFingerprint(inputPath,offset) == checkpoint["fingerprint"]
+
+# Filters the rows of the csv file at <inputPath> appended since the last run
+# recorded in the checkpoint at <checkpointPath>, appending them to
+# <filteredPath> (rows that do not contain any keyword) and <remainderPath>
+# (rows that do), or reruns over the whole file if the checkpoint does not
+# apply. <matcher> is a KeywordMatcher. If <stats> (a runStats.RunStats) is
+# given, the run is recorded as an "incremental" stage.
+# Returns a tuple of the (headers,numFiltered,numRemainder,resumed), where the
+# counts are for the rows processed by this run and resumed is False for a
+# full rerun.
+def filterIncremental(inputPath,filteredPath,remainderPath,headerName,matcher,checkpointPath,encoding=None,stats=None):
+	if (encoding is None):
+		encoding = locale.getpreferredencoding(False)
+	if (not isinstance(matcher,KeywordMatcher)):
+		matcher = KeywordMatcher(matcher)
+	keyHash = keywordHash(headerName,matcher)
+	checkpoint = loadCheckpoint(checkpointPath)
+	resumed = checkpointApplies(checkpoint,inputPath,filteredPath,remainderPath,keyHash)
+
+	if (resumed):
+		start = checkpoint["offset"]
+		headers = checkpoint["headers"]
+		rowCount = checkpoint["rows"]
+		mode = "a"
+	else:
+		start = 0
+		headers = None
+		rowCount = 0
+		mode = "w"
+	end = lastRowBoundary(inputPath,start)
+
+	lines = readLines(inputPath,start,end,encoding)
+	stage = None
+	if (stats is not None):
+		stage = stats.stage("incremental")
+		lines = stage.lines(lines)
+	reader = csv.reader(lines)
+
+	with open(filteredPath,mode,newline="",encoding=encoding) as filteredFile, open(remainderPath,mode,newline="",encoding=encoding) as remainderFile:
+		filteredOut = csv.writer(filteredFile)
+		remainderOut = csv.writer(remainderFile)
+		if (headers is None):
+			headers = next(reader,[])
+			if (len(headers) > 0):
+				filteredOut.writerow(headers)
+				remainderOut.writerow(headers)
+
+		colIdx = columnIndex(headers,headerName)
+		numFiltered,numRemainder = filterRows(reader,colIdx,matcher,filteredOut,remainderOut,stats,stage)
+	if (stage is not None):
+		stage.finish()
+
+	# Until the header row is complete there is nothing to resume from, so
+	# the next run starts over
+	if (len(headers) == 0):
+		if (os.path.isfile(checkpointPath)):
+			os.remove(checkpointPath)
+		return (headers,numFiltered,numRemainder,resumed)
+
+	saveCheckpoint(checkpointPath,{
+		"version": CHECKPOINT_VERSION,
+		"input": os.path.abspath(inputPath),
+		"filtered": os.path.abspath(filteredPath),
+		"remainder": os.path.abspath(remainderPath),
+		"keywordHash": keyHash,
+		"headers": headers,
+		"offset": end,
+		"rows": rowCount + numFiltered + numRemainder,
+		"fingerprint": prefixFingerprint(inputPath,end),
+	})
+	return (headers,numFiltered,numRemainder,resumed)
@@ -0,0 +1,194 @@
+#python3
+################################################################################
+# File: keywordMatcher.py
+# Author: Nate Lao (lao.nathan@yahoo.com)
+# Description:
+#	Pre-compiled multi-keyword matcher used by filterCSV.py. The keyword list
+#   is compiled once, then each string is scanned a single time no matter how
+#   many keywords there are, instead of once per keyword.
+#
+#   Two methods are available:
+#     "regex"        - a single alternation regular expression
+#     "ahocorasick"  - an Aho-Corasick automaton, which stays linear in the
+#                      string length even with thousands of keywords
+#
+#   By default matching is case-insensitive substring matching, like the
+#   original filterOut. wholeWord only accepts matches that are not
+#   surrounded by word characters and caseSensitive disables lowercasing.
+################################################################################
+
+import re
+
+METHODS = ["regex","ahocorasick"]
+
+class KeywordMatcher:
+	def __init__(self,keywordList,method="regex",wholeWord=False,caseSensitive=False):
+		if (method not in METHODS):
+			raise ValueError("unknown keyword matching method: %s" % method)
+		self.method = method
+		self.wholeWord = wholeWord
+		self.caseSensitive = caseSensitive
+		self.keywords = [self.normalize(str(keyword)) for keyword in keywordList]
+
+		# An empty keyword is contained in every string
+		self.matchesAll = ("" in self.keywords)
+
+		if (method == "regex"):
+			self.regex = self.compileRegex()
+		else:
+			self.automaton = AhoCorasick(self.keywords)
+
+	# Lowercases <string> unless matching is case-sensitive
+	def normalize(self,string):
+		return string if self.caseSensitive else string.lower()
+
+	# Returns True if <string> contains any of the keywords
+	def matches(self,string):
+		if (self.matchesAll):
+			return True
+		string = self.normalize(string)
+		if (self.method == "regex"):
+			return self.regex is not None and self.regex.search(string) is not None
+		else:
+			for (start,end,keyword) in self.automaton.finditer(string):
+				if (not self.wholeWord or isWholeWord(string,start,end)):
+					return True
+			return False
+
+	# Returns the first keyword (lowercased unless matching is case-sensitive)
+	# found in <string>, or None. The first keyword is the one that starts
+	# earliest, the longest one if several start at the same position.
+	def findFirst(self,string):
+		# The empty keyword matches at the very start of any string
+		if (self.matchesAll):
+			return ""
+		string = self.normalize(string)
+		if (self.method == "regex"):
+			found = None if self.regex is None else self.regex.search(string)
+			return None if found is None else found.group(0)
+		else:
+			first = None
+			for (start,end,keyword) in self.automaton.finditer(string):
+				if (self.wholeWord and not isWholeWord(string,start,end)):
+					continue
+				if (first is None or (start,-end) < (first[0],-first[1])):
+					first = (start,end,keyword)
+			return None if first is None else first[2]
+
+	# Builds the alternation regex. Longer keywords come first so that the
+	# longest keyword wins at any given position.
+	def compileRegex(self):
+		keywords = sorted(set(self.keywords),key=len,reverse=True)
+		if (len(keywords) == 0):
+			return None
+		pattern = "|".join(re.escape(keyword) for keyword in keywords)
+		if (self.wholeWord):
+			pattern = r"(?<!\w)(?:%s)(?!\w)" % pattern
+		return re.compile(pattern)
+
+# Helpers shared by the filters of filterCSV.py, incrementalFilter.py and
+# chunkedFilter.py, so that they all pick the column and filter rows the same
+# way
+
+# Returns the index of the last of <headers> that is <headerName>, or -1 if
+# there is none
+def columnIndex(headers,headerName):
+	output = -1
+	for (index,col) in enumerate(headers):
+		if (col == headerName):
+			output = index
+	return output
+
+# Returns True if <value> contains any of the keywords of <matcher>. If <stats>
+# (a runStats.RunStats) is given, the first keyword found is counted as a hit.
+def valueMatches(matcher,value,stats=None):
+	if (stats is None):
+		return matcher.matches(value)
+	keyword = matcher.findFirst(value)
+	if (keyword is None):
+		return False
+	stats.hit(keyword)
+	return True
+
+# Writes each of the csv <rows> to the csv writer <filteredOut> if its
+# <colIdx> column does not contain any keyword of <matcher>, or to
+# <remainderOut> if it does. <stats> is passed to valueMatches and each row
+# is counted in <stage> (a runStats.Stage) if given.
+# Returns a tuple of the (numFiltered,numRemainder).
+def filterRows(rows,colIdx,matcher,filteredOut,remainderOut,stats=None,stage=None):
+	numFiltered = 0
+	numRemainder = 0
+	for row in rows:
+		if (not valueMatches(matcher,str(row[colIdx]),stats)):
+			filteredOut.writerow(row)
+			numFiltered += 1
+		else:
+			remainderOut.writerow(row)
+			numRemainder += 1
+		if (stage is not None):
+			stage.update()
+	return (numFiltered,numRemainder)
+
+# Returns True if string[start:end] is not surrounded by word characters
+def isWholeWord(string,start,end):
+	if (start > 0 and (string[start-1].isalnum() or string[start-1] == "_")):
+		return False
+	if (end < len(string) and (string[end].isalnum() or string[end] == "_")):
+		return False
+	return True
+
+# Aho-Corasick automaton over a keyword list. Nodes are numbered, with node 0
+# as the root; each node has a dict of character transitions, a failure link
+# and the list of keywords that end at it (including through failure links).
+class AhoCorasick:
+	def __init__(self,keywordList):
+		self.goto = [{}]
+		self.fail = [0]
+		self.output = [[]]
+
+		# Build the trie
+		for keyword in keywordList:
+			if (keyword == ""):
+				continue
+			node = 0
+			for char in keyword:
+				nextNode = self.goto[node].get(char)
+				if (nextNode is None):
+					nextNode = len(self.goto)
+					self.goto[node][char] = nextNode
+					self.goto.append({})
+					self.fail.append(0)
+					self.output.append([])
+				node = nextNode
+			if (keyword not in self.output[node]):
+				self.output[node].append(keyword)
+
+		# Set the failure links breadth first, so a node's failure link is
+		# always set before its children's
+		queue = list(self.goto[0].values())
+		i = 0
+		while (i < len(queue)):
+			node = queue[i]
+			i += 1
+			for (char,child) in self.goto[node].items():
+				queue.append(child)
+				failNode = self.fail[node]
+				while (failNode != 0 and char not in self.goto[failNode]):
+					failNode = self.fail[failNode]
+				failNode = self.goto[failNode].get(char,0)
+				self.fail[child] = failNode if failNode != child else 0
+				self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+	# Yields (start,end,keyword) for every keyword occurrence in <string>, in
+	# order of the end position
+	def finditer(self,string):
+		goto = self.goto
+		fail = self.fail
+		output = self.output
+		node = 0
+		for (i,char) in enumerate(string):
+			while (node != 0 and char not in goto[node]):
+				node = fail[node]
+			node = goto[node].get(char,0)
+			for keyword in output[node]:
+				yield (i + 1 - len(keyword),i + 1,keyword)
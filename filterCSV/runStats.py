@@ -0,0 +1,151 @@
+#python3
+################################################################################
+# File: runStats.py
+# Author: Nate Lao (lao.nathan@yahoo.com)
+# Description:
+#	Optional throughput instrumentation for filterCSV.py runs. A RunStats
+#   records, for each stage of a run (import, filter, export, ...), the time
+#   spent, the rows and bytes processed, and can print a progress line with
+#   the current rows/s and MB/s while the stage runs. It also keeps per-keyword
+#   hit counts and the peak memory of the process, and produces a final report
+#   that can be saved as JSON.
+#
+#   Bytes are counted on the decoded text (one per character), which matches
+#   the file size for ASCII data and compressed inputs are measured after
+#   decompression.
+################################################################################
+
+import json
+import sys
+import time
+
+try:
+	import resource
+except ImportError:
+	resource = None # not available on Windows
+
+# Number of rows between two checks of the clock for progress lines
+CHECK_EVERY = 4096
+
+# Returns the peak resident memory of the process in bytes, or None if it
+# cannot be measured on this platform
+def peakMemory():
+	if (resource is None):
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# Reported in kilobytes on Linux, in bytes on macOS
+	return peak if sys.platform == "darwin" else peak * 1024
+
+class RunStats:
+	# <progressInterval> is the number of seconds between progress lines,
+	# written to <progressFile>; None disables them
+	def __init__(self,progressInterval=None,progressFile=sys.stderr):
+		self.progressInterval = progressInterval
+		self.progressFile = progressFile
+		self.stages = []
+		self.keywordHits = {}
+		self.startTime = time.perf_counter()
+
+	# Starts timing a new stage called <name> and returns it. Use it as a
+	# context manager, or call its finish method.
+	def stage(self,name):
+		stage = Stage(self,name)
+		self.stages += [stage]
+		return stage
+
+	# Counts one hit of <keyword>
+	def hit(self,keyword):
+		self.keywordHits[keyword] = self.keywordHits.get(keyword,0) + 1
+
+	# Returns the report of the run as a dict
+	def report(self):
+		return {
+			"totalSeconds": time.perf_counter() - self.startTime,
+			"peakMemoryBytes": peakMemory(),
+			"stages": [stage.report() for stage in self.stages],
+			"keywordHits": self.keywordHits,
+		}
+
+	# Writes the report of the run to the file at <path> as JSON
+	def writeReport(self,path):
+		with open(path,"w") as reportFile:
+			json.dump(self.report(),reportFile,indent=2,sort_keys=True)
+
+class Stage:
+	def __init__(self,stats,name):
+		self.stats = stats
+		self.name = name
+		self.rows = 0
+		self.bytes = 0
+		self.startTime = time.perf_counter()
+		self.endTime = None
+		self.nextCheck = CHECK_EVERY
+		self.lastProgress = self.startTime
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self,*excInfo):
+		self.finish()
+
+	# Counts <rows> more rows and <numBytes> more bytes, printing a progress
+	# line if one is due
+	def update(self,rows=1,numBytes=0):
+		self.rows += rows
+		self.bytes += numBytes
+		if (self.rows >= self.nextCheck):
+			self.nextCheck = self.rows + CHECK_EVERY
+			interval = self.stats.progressInterval
+			now = time.perf_counter()
+			if (interval is not None and now - self.lastProgress >= interval):
+				self.lastProgress = now
+				self.printProgress(now)
+
+	# Wraps an iterable of text lines (such as a file passed to csv.reader)
+	# to count the bytes read
+	def lines(self,lineIterable):
+		for line in lineIterable:
+			self.bytes += len(line)
+			yield line
+
+	# Wraps a text file (such as a file passed to csv.writer) to count the
+	# bytes written
+	def writer(self,file):
+		return CountingWriter(self,file)
+
+	# Stops timing the stage
+	def finish(self):
+		if (self.endTime is None):
+			self.endTime = time.perf_counter()
+			if (self.stats.progressInterval is not None):
+				self.printProgress(self.endTime)
+
+	def seconds(self,now=None):
+		end = self.endTime if self.endTime is not None else (now or time.perf_counter())
+		return end - self.startTime
+
+	def printProgress(self,now):
+		seconds = max(self.seconds(now),1e-9)
+		print("[%s] %d rows, %.0f rows/s, %.2f MB/s, %.1f s" % (self.name,self.rows,self.rows / seconds,self.bytes / seconds / 1e6,seconds),file=self.stats.progressFile)
+
+	def report(self):
+		seconds = self.seconds()
+		return {
+			"name": self.name,
+			"seconds": seconds,
+			"rows": self.rows,
+			"bytes": self.bytes,
+			"rowsPerSecond": self.rows / seconds if seconds > 0 else None,
+			"megabytesPerSecond": self.bytes / seconds / 1e6 if seconds > 0 else None,
+		}
+
+# Text file wrapper that adds the length of everything written to the bytes
+# of a Stage
+class CountingWriter:
+	def __init__(self,stage,file):
+		self.stage = stage
+		self.file = file
+
+	def write(self,text):
+		self.stage.bytes += len(text)
+		return self.file.write(text)
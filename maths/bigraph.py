@@ -25,11 +25,91 @@
 ############################################################
 
 import math
+import heapq
+import collections
+import concurrent.futures
+import array
+import mmap
+import struct
+import sys
+from kdtree import Kdtree
+
+# NumPy is only needed for the all pairs API
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+# Scale of the edge density (directed edges over V squared)
+# above which all_pairs uses Floyd-Warshall instead of
+# repeated Djkstra. Floyd-Warshall always costs V^3 (a few ns
+# per step once vectorized, more once the matrices fall out of
+# cache), repeated Djkstra about V * (V + E) Python-level heap
+# steps (a few hundred ns each). Measured on random graphs, the
+# break even density was about 0.010 at 300 vertices, 0.013 at
+# 600, 0.020 at 1200 and 0.030 at 2500, which is close to
+# DENSE_THRESHOLD * sqrt(V), so that is the density all_pairs
+# compares against. Track graphs (degree 4 to 6) stay far
+# below it.
+DENSE_THRESHOLD = 0.0006
 
 class Bigraph:
-	def __init__(self):
+	########################################################
+	# cache_size is the number of shortest path trees (one
+	# per source vertex) kept by djkstra and lcp. A cache_size
+	# of 0 disables the cache.
+	# djkstra always caches the tree of its source. lcp reads
+	# a cached tree on a hit; on a miss it runs a search that
+	# stops at dest, and only computes and caches the full tree
+	# the second time the same source misses (among the last
+	# cache_size sources that missed), so one-off queries keep
+	# the early stop and repeated sources are cached. Every
+	# miss, from djkstra or lcp, counts in cache_misses.
+	########################################################
+	def __init__(self,cache_size=8):
 		self.vertices = []
-		self.edges = []
+		
+		# Search indexes, kept in sync by add_vertex and add_edge.
+		# _index maps a vertex to its position in vertices and
+		# _adj holds, per vertex position, the list of outgoing
+		# (destination position, weight) pairs. _edge_weights
+		# maps the (source, destination) pair of every edge to
+		# its weight, in insertion order; Edge objects are only
+		# built from it when edges is read.
+		self._index = {}
+		self._adj = []
+		self._edge_weights = {}
+		self._edge_list = None
+		
+		# True while every vertex is a 2-tuple, which is what
+		# the A* heuristic in lcp requires
+		self._planar = True
+		
+		# Spatial index over the positions of all 2-tuple
+		# vertices, for the nearest vertex queries
+		self._spatial = Kdtree()
+		
+		# LRU cache of shortest path trees, mapping a source
+		# position to its (predecessor positions, weights) pair.
+		# Trees are repaired in place when the graph grows.
+		self.cache_size = cache_size
+		self.cache_hits = 0
+		self.cache_misses = 0
+		self._cache = collections.OrderedDict()
+		
+		# Sources whose last lcp missed the cache, oldest first
+		self._lcp_missed = collections.OrderedDict()
+	
+	########################################################
+	# List of all edges in the graph, two per undirected edge.
+	# Built on first access after the graph changes.
+	########################################################
+	@property
+	def edges(self):
+		if self._edge_list == None:
+			Edge = self.Edge
+			self._edge_list = [Edge(vs,vd,weight) for ((vs,vd),weight) in self._edge_weights.items()]
+		return self._edge_list
 	
 	########################################################
 	# Returns a list of vertices representing the least cost
@@ -37,31 +117,72 @@ class Bigraph:
 	# This is calculated using the djkstra function.
 	# Returns a list from the source vertex (exclusive) to the
 	# destination vertex (inclusive).
+	# If astar is True, the search is guided towards dest by
+	# the straight-line distance to it (A* search). Since
+	# edge weights are Euclidean distances, this never
+	# overestimates and the returned path is still the least
+	# cost path. Graphs whose vertices are not all 2-tuples
+	# fall back to plain Djkstra.
+	# See __init__ for how lcp uses the cache.
 	########################################################
-	def lcp(self,source,dest):
+	def lcp(self,source,dest,astar=False):
 		# If the source and dest vertices do not exist, return None
-		if (source not in self.vertices or dest not in self.vertices): 
+		if (source not in self._index or dest not in self._index): 
 			return None
 		
-		#TODO Debug
-		#print("Performing Djkstra")
-		preds = self.djkstra(source)[0]
-		path = []
-		
-		while (dest != source and dest != None):
-			path.insert(0,dest)
-			dest = preds[self.vertices.index(dest)]			
-		
-		# Finally, add the source vertex
-		path.insert(0,source)
-		
-		if (dest != source):
-			print("ERROR: No viable path from source to destination vertex found.")
-			return None
+		source_i = self._index[source]
+		dest_i = self._index[dest]
+		if (source_i in self._cache or source_i in self._lcp_missed):
+			self._lcp_missed.pop(source_i,None)
+			preds = self._cached_search(source_i)[0]
 		else:
-			#TODO Debug
-			#print("Finding best path")
-			return path
+			self.cache_misses += 1
+			if self.cache_size > 0:
+				self._lcp_missed[source_i] = True
+				while len(self._lcp_missed) > self.cache_size:
+					self._lcp_missed.popitem(last=False)
+			# The search halts as soon as dest is settled, so only
+			# the part of the graph closer than dest is expanded
+			if (astar and self._planar):
+				preds = self._search(source_i,dest_i,_euclid_heuristic(self.vertices,dest))[0]
+			else:
+				preds = self._search(source_i,dest_i)[0]
+		return _trace_path(self.vertices,preds,source_i,dest_i)
+	
+	########################################################
+	# Same as lcp, but starting from an arbitrary point (such
+	# as the car's position) instead of a vertex: the path
+	# starts at the vertex nearest to the point.
+	########################################################
+	def lcp_from_point(self,point,dest,astar=False):
+		source = self.nearest(point)
+		if source == None:
+			return None
+		return self.lcp(source,dest,astar)
+	
+	########################################################
+	# Returns the vertex closest to the given point, or None
+	# if the graph has no 2-tuple vertices. Only 2-tuple
+	# vertices are indexed and returned by the spatial
+	# queries.
+	########################################################
+	def nearest(self,point):
+		found = self._spatial.nearest(point)
+		return None if found == None else self.vertices[found[0]]
+	
+	########################################################
+	# Returns the k vertices closest to the given point,
+	# closest first.
+	########################################################
+	def k_nearest(self,point,k):
+		return [self.vertices[i] for (i,_) in self._spatial.k_nearest(point,k)]
+	
+	########################################################
+	# Returns all vertices within distance r of the given
+	# point, closest first.
+	########################################################
+	def within_radius(self,point,r):
+		return [self.vertices[i] for (i,_) in self._spatial.within_radius(point,r)]
 	
 	########################################################
 	# Performs Djkstra's algorithm on the graph based on the
@@ -72,57 +193,166 @@ class Bigraph:
 	#	-a list of all corresponding path weights in vertices
 	########################################################	
 	def djkstra(self,source):
-		if (source not in self.vertices):
+		if (source not in self._index):
 			print("ERROR: Source vertex not found in the graph.")
 			return None
+		
+		(pred_is,weights) = self._cached_search(self._index[source])
+		preds = [None if i == None else self.vertices[i] for i in pred_is]
+		return (preds,list(weights))
 	
-		# Number of vertices in the graph	
-		NUM_V = len(self.vertices)
+	########################################################
+	# Returns a 4-tuple of the cache hits, cache misses,
+	# number of cached trees and maximum number of cached
+	# trees, in the spirit of functools.lru_cache.
+	########################################################
+	def cache_info(self):
+		return (self.cache_hits,self.cache_misses,len(self._cache),self.cache_size)
+	
+	########################################################
+	# Empties the shortest path tree cache and resets its
+	# counters.
+	########################################################
+	def cache_clear(self):
+		self._cache.clear()
+		self._lcp_missed.clear()
+		self.cache_hits = 0
+		self.cache_misses = 0
+	
+	########################################################
+	# Returns the full shortest path tree of the source
+	# position, from the cache if possible. Trees computed on
+	# a miss are cached, evicting the least recently used
+	# tree once cache_size is reached. The returned lists
+	# are shared with the cache and must not be modified.
+	########################################################
+	def _cached_search(self,source_i):
+		cache = self._cache
+		if source_i in cache:
+			self.cache_hits += 1
+			cache.move_to_end(source_i)
+			return cache[source_i]
 		
-		weights = [] # Weight of each vertex
-		traversed = [] # True or False depending if the vertex has been traversed
-		num_traversed = 0 # Number of vertices processed
-		preds = [] # Contains the preceding vertex
-		
-		# Initialization: set weights to infinity except for source
-		# Set traversed for all vertices to False
-		# Set predecessor for all vertices to None
-		for vertex in self.vertices:
-			weights.append(0 if vertex == source else math.inf)
-			traversed.append(False)
-			preds.append(None)
-			
-		while num_traversed < NUM_V:
-			# Find the vertex with the smallest weight
-			min_i = -1
-			min_w = math.inf
-			for i in range(0,NUM_V):
-				if (not traversed[i] and weights[i] <= min_w):
-					min_i = i
-					min_w = weights[i]
-			min_v = self.vertices[min_i]
-			
-			# Find all outgoing paths from the min vertex
-			# Replace the destination's preds and weight 
-			# if a shorter distance is found
-			out_edges = self.find_edges(min_v)
-			for edge in out_edges:
-				# The new weight is the sum of the current edge's
-				# weight and the current minimum vertex
-				new_weight = edge.weight + weights[min_i]
-				
-				# If the new weight is less than the destination's
-				# current weight, replace its predecessor and weight
-				dest_i = self.vertices.index(edge.vd)
-				if (new_weight < weights[dest_i]):
-					weights[dest_i] = new_weight
-					preds[dest_i] = edge.vs
-			
-			# Keep track of the traversed vertices
-			traversed[min_i] = True
-			num_traversed += 1
+		self.cache_misses += 1
+		tree = self._search(source_i)
+		if self.cache_size > 0:
+			cache[source_i] = tree
+			while len(cache) > self.cache_size:
+				cache.popitem(last=False)
+		return tree
+	
+	########################################################
+	# Repairs every cached tree after an edge of the given
+	# weight was added between positions vs_i and vd_i.
+	# Adding an edge can only shorten paths, so only the
+	# vertices that become closer through the new edge (and
+	# their descendants) need to be revisited; this is done
+	# by resuming the search from the improved endpoint.
+	########################################################
+	def _repair_cache(self,vs_i,vd_i,weight):
+		adj = self._adj
+		for (preds,weights) in self._cache.values():
+			heap = []
+			for (u,v) in ((vs_i,vd_i),(vd_i,vs_i)):
+				new_weight = weights[u] + weight
+				if (new_weight < weights[v]):
+					weights[v] = new_weight
+					preds[v] = u
+					heap.append((new_weight,v))
+			heapq.heapify(heap)
 			
-		return (preds,weights)
+			while heap:
+				(min_w,min_i) = heapq.heappop(heap)
+				if (min_w > weights[min_i]):
+					continue
+				for (next_i,next_weight) in adj[min_i]:
+					new_weight = min_w + next_weight
+					if (new_weight < weights[next_i]):
+						weights[next_i] = new_weight
+						preds[next_i] = min_i
+						heapq.heappush(heap,(new_weight,next_i))
+	
+	########################################################
+	# Runs the search engine (see _heap_search) on this graph.
+	########################################################
+	def _search(self,source_i,dest_i=None,heuristic=None):
+		return _heap_search(self._adj,len(self.vertices),source_i,dest_i,heuristic)
+	
+	########################################################
+	# Computes the least cost between every pair of vertices.
+	# Returns a 2-tuple of NumPy V x V matrices, indexed by
+	# vertex position in vertices:
+	#	-a float64 matrix of path weights, where unreachable
+	#		pairs are math.inf
+	#	-an int64 matrix where [i][j] is the position of the
+	#		predecessor of vertex j on the path from vertex i,
+	#		or -1 if there is none
+	# method is "floyd" (vectorized Floyd-Warshall), "djkstra"
+	# (one heap search per source) or None to choose from the
+	# edge density. With processes greater than 1, the
+	# djkstra method fans the sources out over a process pool.
+	########################################################
+	def all_pairs(self,method=None,processes=None):
+		if np == None:
+			raise ImportError("all_pairs requires numpy")
+		
+		NUM_V = len(self.vertices)
+		if method == None:
+			num_e = sum(len(out) for out in self._adj)
+			dense = NUM_V > 0 and num_e >= DENSE_THRESHOLD * math.sqrt(NUM_V) * NUM_V * NUM_V
+			method = "floyd" if dense else "djkstra"
+		
+		if method == "floyd":
+			return self._floyd_warshall()
+		elif method == "djkstra":
+			return self._repeated_djkstra(processes)
+		else:
+			raise ValueError("unknown all pairs method: %s" % method)
+	
+	########################################################
+	# Floyd-Warshall over NumPy matrices; each intermediate
+	# vertex k is one vectorized pass over the whole matrix.
+	########################################################
+	def _floyd_warshall(self):
+		NUM_V = len(self.vertices)
+		dist = np.full((NUM_V,NUM_V),math.inf)
+		pred = np.full((NUM_V,NUM_V),-1,dtype=np.int64)
+		for (i,out) in enumerate(self._adj):
+			for (j,weight) in out:
+				if (weight < dist[i,j]):
+					dist[i,j] = weight
+					pred[i,j] = i
+		np.fill_diagonal(dist,0)
+		np.fill_diagonal(pred,-1)
+		
+		for k in range(NUM_V):
+			through_k = dist[:,k,np.newaxis] + dist[np.newaxis,k,:]
+			shorter = through_k < dist
+			np.copyto(dist,through_k,where=shorter)
+			np.copyto(pred,np.broadcast_to(pred[k],pred.shape),where=shorter)
+		return (dist,pred)
+	
+	########################################################
+	# One heap search per source, optionally spread over a
+	# process pool. Workers receive the adjacency lists once,
+	# when they start, and then only source ranges.
+	########################################################
+	def _repeated_djkstra(self,processes=None):
+		NUM_V = len(self.vertices)
+		dist = np.empty((NUM_V,NUM_V))
+		pred = np.empty((NUM_V,NUM_V),dtype=np.int64)
+		
+		if (processes == None or processes <= 1 or NUM_V < 2):
+			_apsp_init(self._adj)
+			for source_i in range(NUM_V):
+				(_,dist[source_i],pred[source_i]) = _apsp_row(source_i)
+		else:
+			with concurrent.futures.ProcessPoolExecutor(processes,initializer=_apsp_init,initargs=(self._adj,)) as pool:
+				chunksize = max(1,NUM_V // (processes * 4))
+				for (source_i,dist_row,pred_row) in pool.map(_apsp_row,range(NUM_V),chunksize=chunksize):
+					dist[source_i] = dist_row
+					pred[source_i] = pred_row
+		return (dist,pred)
 	
 	########################################################
 	# Returns all of the outgoing edges from a given vertex.
@@ -131,11 +361,9 @@ class Bigraph:
 	# a list of all outgoing edges are returned.
 	########################################################
 	def find_edges(self,vertex):
-		if vertex in self.vertices:
-			out_edges = []
-			for edge in self.edges:
-				if edge.vs == vertex: out_edges.append(edge)
-			return out_edges
+		if vertex in self._index:
+			vertices = self.vertices
+			return [self.Edge(vertex,vertices[next_i],weight) for (next_i,weight) in self._adj[self._index[vertex]]]
 		else:
 			return []
 		
@@ -145,10 +373,21 @@ class Bigraph:
 	# vertex is added and True is returned.
 	########################################################
 	def add_vertex(self,vertex):
-		if vertex in self.vertices:			
+		if vertex in self._index:			
 			return False
 		else:
+			self._index[vertex] = len(self.vertices)
+			self._adj.append([])
 			self.vertices.append(vertex)
+			if self._is_planar(vertex):
+				self._spatial.insert(vertex,self._index[vertex])
+			else:
+				self._planar = False
+			# A new vertex has no edges yet, so it is simply
+			# unreachable in every cached tree
+			for (preds,weights) in self._cache.values():
+				preds.append(None)
+				weights.append(math.inf)
 			return True
 	
 	########################################################
@@ -162,19 +401,145 @@ class Bigraph:
 	# bi-directional.
 	########################################################
 	def add_edge(self,vs,vd):
-		if (vs not in self.vertices or vd not in self.vertices):
+		if (vs not in self._index or vd not in self._index):
+			return False
+		# Both directions are always added together, so checking
+		# the forward edge is enough
+		elif ((vs,vd) in self._edge_weights):
 			return False
 		else:
-			fwd_new_edge = self.Edge(vs,vd)
-			bkw_new_edge = self.Edge(vd,vs)
-			
-			if (fwd_new_edge in self.edges or bkw_new_edge in self.edges):
-				return False
-			else:
-				self.edges.append(fwd_new_edge)
-				self.edges.append(bkw_new_edge)
-				return True
+			weight = self.Edge.distance(vs,vd)
+			self._edge_weights[(vs,vd)] = weight
+			self._edge_weights[(vd,vs)] = weight
+			self._edge_list = None
+			vs_i = self._index[vs]
+			vd_i = self._index[vd]
+			self._adj[vs_i].append((vd_i,weight))
+			self._adj[vd_i].append((vs_i,weight))
+			self._repair_cache(vs_i,vd_i,weight)
+			return True
+	
+	########################################################
+	# Adds every vertex of an iterable to the graph in a single
+	# pass. Vertices that already exist (or are repeated in the
+	# iterable) are skipped. Returns the number of vertices
+	# that were added.
+	########################################################
+	def add_vertices(self,vertices):
+		index = self._index
+		adj = self._adj
+		new_vertices = self.vertices
+		start = len(new_vertices)
+		for vertex in vertices:
+			if vertex not in index:
+				index[vertex] = len(new_vertices)
+				adj.append([])
+				new_vertices.append(vertex)
+				if not self._is_planar(vertex):
+					self._planar = False
+		self._spatial.extend((new_vertices[i],i) for i in range(start,len(new_vertices)) if self._is_planar(new_vertices[i]))
+		for (preds,weights) in self._cache.values():
+			grow = len(new_vertices) - len(preds)
+			preds.extend([None] * grow)
+			weights.extend([math.inf] * grow)
+		return len(new_vertices) - start
+	
+	########################################################
+	# Returns True if the vertex is a 2-tuple of coordinates.
+	########################################################
+	@staticmethod
+	def _is_planar(vertex):
+		return isinstance(vertex,tuple) and len(vertex) == 2
+	
+	########################################################
+	# Adds every (vs,vd) pair of an iterable as an edge in a
+	# single pass, following the same rules as add_edge: pairs
+	# with a missing vertex and edges that already exist are
+	# skipped. Returns the number of edges that were added
+	# (each counted once, not once per direction).
+	########################################################
+	def add_edges(self,pairs):
+		distance = self.Edge.distance
+		return self._insert_edges((vs,vd,distance(vs,vd)) for (vs,vd) in pairs)
+	
+	########################################################
+	# Batch version of add_edges for coordinate arrays.
+	# sources and dests are N x 2 array-likes holding the
+	# coordinates of the source and destination vertex of
+	# each edge. All N weights are computed in one vectorized
+	# NumPy pass and both directions are inserted straight
+	# into the graph indexes, without creating Edge objects.
+	# Returns the number of edges that were added.
+	########################################################
+	def add_edges_array(self,sources,dests):
+		if np == None:
+			raise ImportError("add_edges_array requires numpy")
 		
+		sources = np.asarray(sources,dtype=float)
+		dests = np.asarray(dests,dtype=float)
+		if (sources.shape != dests.shape or sources.ndim != 2 or sources.shape[1] != 2):
+			raise ValueError("sources and dests must both be N x 2 arrays")
+		
+		weights = np.hypot(sources[:,0] - dests[:,0],sources[:,1] - dests[:,1])
+		return self._insert_edges(zip(map(tuple,sources.tolist()),map(tuple,dests.tolist()),weights.tolist()))
+	
+	########################################################
+	# Shared insertion loop of add_edges and add_edges_array,
+	# taking (vs,vd,weight) triples.
+	########################################################
+	def _insert_edges(self,triples):
+		index = self._index
+		adj = self._adj
+		edge_weights = self._edge_weights
+		added = 0
+		for (vs,vd,weight) in triples:
+			if (vs not in index or vd not in index or (vs,vd) in edge_weights):
+				continue
+			vs_i = index[vs]
+			vd_i = index[vd]
+			# Key on the stored vertices so that, e.g., integer
+			# vertices are not duplicated as float coordinates
+			vs = self.vertices[vs_i]
+			vd = self.vertices[vd_i]
+			edge_weights[(vs,vd)] = weight
+			edge_weights[(vd,vs)] = weight
+			adj[vs_i].append((vd_i,weight))
+			adj[vd_i].append((vs_i,weight))
+			added += 1
+		
+		# Repairing every tree edge by edge can cost more than
+		# recomputing it, so bulk loads drop the cache instead
+		if added > 0:
+			self._edge_list = None
+			self._cache.clear()
+		return added
+	
+	########################################################
+	# Compiles the graph into a CompactBigraph: a frozen copy
+	# with integer vertex ids and flat CSR adjacency arrays,
+	# which is much smaller than the Edge objects and can be
+	# searched directly. Later changes to this graph are not
+	# reflected in the compiled copy.
+	########################################################
+	def compile(self):
+		offsets = array.array("q",[0])
+		targets = array.array("q")
+		weights = array.array("d")
+		for out in self._adj:
+			for (next_i,weight) in out:
+				targets.append(next_i)
+				weights.append(weight)
+			offsets.append(len(targets))
+		return CompactBigraph(list(self.vertices),offsets,targets,weights)
+	
+	########################################################
+	# Writes the graph to a binary file that can be opened
+	# memory-mapped with CompactBigraph.load. See
+	# CompactBigraph.save for the format.
+	########################################################
+	def save(self,path):
+		self.compile().save(path)
+	
 	########################################################
 	# Inner class definition of an edge. An edge is defined
 	# as a straight line from the source vertex to the destination
@@ -183,16 +548,23 @@ class Bigraph:
 	# meaning that there is a source vertex and a destination vertex.
 	########################################################	
 	class Edge:
-		def __init__(self,vs,vd):
+		# Edges are numerous, so no per-instance __dict__
+		__slots__ = ("vs","vd","weight")
+		
+		####################################################
+		# The weight is computed unless it is already known.
+		####################################################
+		def __init__(self,vs,vd,weight=None):
 			self.vs = vs
 			self.vd = vd
-			self.weight = self.weight(vs,vd)
+			self.weight = self.distance(vs,vd) if weight == None else weight
 			
 		####################################################
 		# Weight is defined as the euclidean distance between
 		# two vertices.
 		####################################################
-		def weight(self,vs,vd):
+		@staticmethod
+		def distance(vs,vd):
 			(x0,y0) = vs
 			(x1,y1) = vd
 			return math.sqrt(math.pow((x0-x1),2) + math.pow((y0-y1),2))
@@ -206,6 +578,12 @@ class Bigraph:
 			else:
 				return False
 		
+		####################################################
+		# Override hash method, consistent with __eq__
+		####################################################
+		def __hash__(self):
+			return hash((self.vs,self.vd))
+		
 		####################################################
 		# String output representation
 		####################################################
@@ -213,7 +591,313 @@ class Bigraph:
 			return "{} -> {} w: {}".format(self.vs,self.vd,self.weight)
 		
 
+############################################################
+# Frozen, compact form of a Bigraph, as returned by
+# Bigraph.compile. Vertices are identified by integer ids (their
+# position in vertices) and the adjacency is stored in CSR form:
+# the outgoing edges of vertex i are targets[offsets[i]:offsets[i+1]]
+# with the matching weights. offsets and targets are int64 and
+# weights float64 buffers (array.array or anything supporting
+# memoryview). Each undirected edge is still stored once per
+# direction, as in Bigraph.
+#
+# A CompactBigraph of 2-tuple vertices can be saved to a binary
+# file and loaded back memory-mapped; see save and load.
+############################################################
+class CompactBigraph:
+	def __init__(self,vertices,offsets,targets,weights,planar=None):
+		self.vertices = vertices
+		self.offsets = offsets
+		self.targets = targets
+		self.weights = weights
+		self._adj = _CsrAdjacency(offsets,targets,weights)
+		self._index = None
+		self._mmap = None
+		if planar == None:
+			planar = all(Bigraph._is_planar(vertex) for vertex in vertices)
+		self._planar = planar
+	
+	########################################################
+	# Writes the graph to a binary file made of a header
+	# (FILE_MAGIC, then the vertex and directed edge counts
+	# as little-endian uint64) followed by four little-endian
+	# arrays:
+	#	-the vertex coordinates, 2 float64 per vertex
+	#	-the CSR offsets, V+1 int64
+	#	-the CSR targets, E int64
+	#	-the CSR weights, E float64
+	# Every section is a multiple of 8 bytes long, so all
+	# arrays are aligned. Only graphs whose vertices are all
+	# 2-tuples can be saved.
+	########################################################
+	def save(self,path):
+		if not self._planar:
+			raise ValueError("only graphs of 2-tuple vertices can be saved")
+		
+		coords = array.array("d")
+		for (x,y) in self.vertices:
+			coords.append(x)
+			coords.append(y)
+		
+		with open(path,"wb") as out:
+			out.write(FILE_MAGIC)
+			out.write(struct.pack("<QQ",self.num_vertices(),self.num_edges()))
+			for (fmt,buf) in (("d",coords),("q",self.offsets),("q",self.targets),("d",self.weights)):
+				out.write(memoryview(_to_little(fmt,buf)).cast("B"))
+	
+	########################################################
+	# Opens a file written by save. The file is memory-mapped
+	# read-only and the arrays are memoryviews straight into
+	# the mapping, so nothing is parsed and processes loading
+	# the same file share one page-cached copy. Vertices are
+	# only turned into tuples when they are accessed.
+	# On big-endian machines the arrays are byte swapped
+	# into copies instead.
+	########################################################
+	@classmethod
+	def load(cls,path):
+		with open(path,"rb") as file:
+			data = mmap.mmap(file.fileno(),0,access=mmap.ACCESS_READ)
+		
+		header_size = len(FILE_MAGIC) + 16
+		if (len(data) < header_size or data[:len(FILE_MAGIC)] != FILE_MAGIC):
+			data.close()
+			raise ValueError("%s is not a Bigraph file" % path)
+		(num_v,num_e) = struct.unpack_from("<QQ",data,len(FILE_MAGIC))
+		
+		view = memoryview(data)
+		sections = []
+		start = header_size
+		for (fmt,count) in (("d",2 * num_v),("q",num_v + 1),("q",num_e),("d",num_e)):
+			end = start + 8 * count
+			if end > len(data):
+				raise ValueError("%s is truncated" % path)
+			sections.append(_from_little(fmt,view[start:end]))
+			start = end
+		(coords,offsets,targets,weights) = sections
+		
+		graph = cls(_CoordView(coords),offsets,targets,weights,planar=True)
+		graph._mmap = data
+		return graph
+	
+	########################################################
+	# Returns the number of vertices and the number of
+	# directed edges.
+	########################################################
+	def num_vertices(self):
+		return len(self.offsets) - 1
+	
+	def num_edges(self):
+		return len(self.targets)
+	
+	########################################################
+	# Returns the integer id of a vertex, or None if the
+	# vertex is not in the graph. The vertex to id mapping is
+	# only built on first use.
+	########################################################
+	def vertex_id(self,vertex):
+		if self._index == None:
+			self._index = {v: i for (i,v) in enumerate(self.vertices)}
+		return self._index.get(vertex)
+	
+	########################################################
+	# Same as Bigraph.lcp, run against the CSR arrays.
+	########################################################
+	def lcp(self,source,dest,astar=False):
+		source_i = self.vertex_id(source)
+		dest_i = self.vertex_id(dest)
+		if (source_i == None or dest_i == None):
+			return None
+		
+		if (astar and self._planar):
+			preds = self.search(source_i,dest_i,_euclid_heuristic(self.vertices,dest))[0]
+		else:
+			preds = self.search(source_i,dest_i)[0]
+		return _trace_path(self.vertices,preds,source_i,dest_i)
+	
+	########################################################
+	# Same as Bigraph.djkstra, run against the CSR arrays.
+	########################################################
+	def djkstra(self,source):
+		source_i = self.vertex_id(source)
+		if (source_i == None):
+			print("ERROR: Source vertex not found in the graph.")
+			return None
+		
+		(pred_is,weights) = self.search(source_i)
+		preds = [None if i == None else self.vertices[i] for i in pred_is]
+		return (preds,weights)
+	
+	########################################################
+	# Runs the search engine (see _heap_search) directly on
+	# vertex ids. Returns the predecessor id list and the path
+	# weight list.
+	########################################################
+	def search(self,source_i,dest_i=None,heuristic=None):
+		return _heap_search(self._adj,self.num_vertices(),source_i,dest_i,heuristic)
+
+# First bytes of a binary graph file written by CompactBigraph.save
+FILE_MAGIC = b"BIGRAPH1"
 
+############################################################
+# Binary graph files are little-endian. On little-endian
+# machines arrays are written and read as they are; on
+# big-endian ones they go through a byte swapped copy.
+############################################################
+def _to_little(fmt,buf):
+	if sys.byteorder == "little":
+		return buf
+	swapped = array.array(fmt,buf)
+	swapped.byteswap()
+	return swapped
+
+############################################################
+# Returns the bytes of a little-endian section as a sequence
+# of fmt values: a memoryview into the bytes on little-endian
+# machines, a byte swapped array copy otherwise.
+############################################################
+def _from_little(fmt,section):
+	if sys.byteorder == "little":
+		return section.cast(fmt)
+	values = array.array(fmt)
+	values.frombytes(section)
+	values.byteswap()
+	return values
+
+############################################################
+# Read-only sequence of 2-tuple vertices over a flat buffer of
+# x,y coordinates, so that a loaded graph does not need to hold
+# a tuple per vertex.
+############################################################
+class _CoordView:
+	def __init__(self,coords):
+		self.coords = coords
+	
+	def __len__(self):
+		return len(self.coords) // 2
+	
+	def __getitem__(self,i):
+		if i < 0:
+			i += len(self)
+		if not (0 <= i < len(self)):
+			raise IndexError("vertex id out of range")
+		return (self.coords[2 * i],self.coords[2 * i + 1])
+	
+	def __iter__(self):
+		coords = self.coords
+		for i in range(0,len(coords),2):
+			yield (coords[i],coords[i + 1])
 
+############################################################
+# Read-only adjacency view over CSR arrays, with the same
+# interface as Bigraph._adj: indexing it with a vertex id gives
+# its outgoing (id, weight) pairs. Slices are taken through
+# memoryviews so no copies of the arrays are made.
+############################################################
+class _CsrAdjacency:
+	def __init__(self,offsets,targets,weights):
+		self.offsets = memoryview(offsets)
+		self.targets = memoryview(targets)
+		self.weights = memoryview(weights)
+	
+	def __len__(self):
+		return len(self.offsets) - 1
+	
+	def __getitem__(self,i):
+		start = self.offsets[i]
+		end = self.offsets[i+1]
+		return zip(self.targets[start:end],self.weights[start:end])
+
+############################################################
+# Returns the list of vertices on the path from source_i to
+# dest_i given the predecessor list of a search from source_i,
+# or None (with an error message) if dest_i was not reached.
+############################################################
+def _trace_path(vertices,preds,source_i,dest_i):
+	path = []
+	cur_i = dest_i
+	while (cur_i != source_i and cur_i != None):
+		path.append(vertices[cur_i])
+		cur_i = preds[cur_i]
+	
+	# Finally, add the source vertex
+	path.append(vertices[source_i])
+	
+	if (cur_i != source_i):
+		print("ERROR: No viable path from source to destination vertex found.")
+		return None
+	else:
+		path.reverse()
+		return path
+
+############################################################
+# Returns the A* heuristic function for a search towards dest:
+# the straight-line distance from the vertex with a given id to
+# dest.
+############################################################
+def _euclid_heuristic(vertices,dest):
+	(x1,y1) = dest
+	def heuristic(i):
+		(x0,y0) = vertices[i]
+		return math.hypot(x0-x1,y0-y1)
+	return heuristic
+
+############################################################
+# Priority queue engine behind djkstra and lcp. Works on
+# vertex positions rather than vertices: adj[i] is the list of
+# outgoing (position, weight) pairs of the vertex at position i
+# and NUM_V is the number of vertices. Vertices are
+# settled in order of increasing weight; if dest_i is
+# given, the search stops once it has been settled.
+# If a heuristic function is given, vertices are instead
+# settled in order of weight plus heuristic(position),
+# which turns the search into A*.
+# Stale heap entries (superseded by a shorter path) are
+# skipped when popped instead of being removed.
+# Returns a 2-tuple of the predecessor position list and
+# the path weight list.
+############################################################
+def _heap_search(adj,NUM_V,source_i,dest_i=None,heuristic=None):
+	weights = [math.inf] * NUM_V
+	preds = [None] * NUM_V
+	settled = [False] * NUM_V
+	
+	weights[source_i] = 0
+	heap = [(0,source_i)]
+	while heap:
+		min_i = heapq.heappop(heap)[1]
+		if settled[min_i]:
+			continue
+		settled[min_i] = True
+		if min_i == dest_i:
+			break
+		
+		# Relax all outgoing edges of the min vertex
+		min_w = weights[min_i]
+		for (next_i,weight) in adj[min_i]:
+			new_weight = min_w + weight
+			if (new_weight < weights[next_i]):
+				weights[next_i] = new_weight
+				preds[next_i] = min_i
+				if heuristic == None:
+					heapq.heappush(heap,(new_weight,next_i))
+				else:
+					heapq.heappush(heap,(new_weight + heuristic(next_i),next_i))
+	
+	return (preds,weights)
+
+############################################################
+# Process pool helpers for Bigraph.all_pairs. _apsp_init
+# stores the adjacency lists once per worker process and
+# _apsp_row returns the (source, weights, predecessors) row
+# of one source, with -1 standing in for no predecessor.
+############################################################
+_apsp_adj = None
 
+def _apsp_init(adj):
+	global _apsp_adj
+	_apsp_adj = adj
 
+def _apsp_row(source_i):
+	(preds,weights) = _heap_search(_apsp_adj,len(_apsp_adj),source_i)
+	return (source_i,weights,[-1 if i == None else i for i in preds])
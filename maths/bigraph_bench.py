@@ -0,0 +1,242 @@
+############################################################
+# File: bigraph_bench.py
+# Path: python_utils/
+# Author: Nathaniel Lao (lao.nathan95@gmail.com)
+#
+# Benchmark suite for bigraph.py. Generates synthetic tracks
+# of configurable size, times graph construction, single
+# source (djkstra) and point-to-point (lcp) queries, records
+# the memory peak of construction and stores the results as
+# JSON so that runs can be compared against a baseline.
+#
+# Track kinds:
+#	-grid: a square grid of checkpoints, each connected to
+#		its right and upper neighbours
+#	-geometric: uniformly random checkpoints, each connected
+#		to every checkpoint within a radius chosen so that
+#		the average degree is about 6
+#
+# Construction is timed both with the bulk API and with one
+# add_vertex/add_edge call per vertex and edge, the latter
+# only up to --incremental-max checkpoints. Queries are drawn
+# from the largest connected component of the track, so that
+# every lcp has a path.
+#
+# Usage:
+#     bigraph_bench.py [--sizes N ...] [--kinds KIND ...]
+#                      [--queries Q] [--seed S] [--output FILE]
+#                      [--baseline FILE] [--tolerance T]
+#                      [--incremental-max N]
+############################################################
+
+import argparse
+import json
+import math
+import platform
+import random
+import time
+import tracemalloc
+
+from bigraph import Bigraph
+
+############################################################
+# Returns the (vertices, edge pairs) of a grid track of about
+# n checkpoints.
+############################################################
+def grid_track(n,rng=None):
+	side = max(2,int(math.isqrt(n)))
+	vertices = [(float(x),float(y)) for y in range(side) for x in range(side)]
+	pairs = []
+	for y in range(side):
+		for x in range(side):
+			if x + 1 < side:
+				pairs.append(((float(x),float(y)),(float(x + 1),float(y))))
+			if y + 1 < side:
+				pairs.append(((float(x),float(y)),(float(x),float(y + 1))))
+	return (vertices,pairs)
+
+############################################################
+# Returns the (vertices, edge pairs) of a random geometric
+# track of n checkpoints in a square of side sqrt(n). Edges
+# are found by bucketing the checkpoints into cells of the
+# connection radius, so generation stays linear in n.
+############################################################
+def geometric_track(n,rng=None,degree=6):
+	rng = rng or random.Random()
+	side = math.sqrt(n)
+	radius = math.sqrt(degree / math.pi)
+	vertices = [(rng.uniform(0,side),rng.uniform(0,side)) for _ in range(n)]
+
+	cells = {}
+	for vertex in vertices:
+		cells.setdefault((int(vertex[0] // radius),int(vertex[1] // radius)),[]).append(vertex)
+
+	pairs = []
+	for ((cx,cy),members) in cells.items():
+		for dx in (-1,0,1):
+			for dy in (-1,0,1):
+				for vs in members:
+					for vd in cells.get((cx + dx,cy + dy),()):
+						if (vs < vd and math.dist(vs,vd) <= radius):
+							pairs.append((vs,vd))
+	return (vertices,pairs)
+
+TRACKS = {"grid": grid_track,"geometric": geometric_track}
+
+############################################################
+# Returns the wall time of calling fn() in seconds, along
+# with its result.
+############################################################
+def timed(fn):
+	start = time.perf_counter()
+	result = fn()
+	return (time.perf_counter() - start,result)
+
+############################################################
+# Builds a Bigraph from a track with the bulk API.
+############################################################
+def build(vertices,pairs):
+	graph = Bigraph(cache_size=0)
+	graph.add_vertices(vertices)
+	graph.add_edges(pairs)
+	return graph
+
+############################################################
+# Builds a Bigraph from a track one add_vertex/add_edge call
+# at a time, as a track that grows checkpoint by checkpoint
+# would.
+############################################################
+def build_incremental(vertices,pairs):
+	graph = Bigraph(cache_size=0)
+	for vertex in vertices:
+		graph.add_vertex(vertex)
+	for (vs,vd) in pairs:
+		graph.add_edge(vs,vd)
+	return graph
+
+############################################################
+# Returns the list of the vertices in the largest connected
+# component of a track, in the order of vertices. Uses a
+# union-find over the edge pairs.
+############################################################
+def largest_component(vertices,pairs):
+	parent = {vertex: vertex for vertex in vertices}
+	def find(vertex):
+		root = vertex
+		while parent[root] != root:
+			root = parent[root]
+		while parent[vertex] != root:
+			(parent[vertex],vertex) = (root,parent[vertex])
+		return root
+	for (vs,vd) in pairs:
+		(rs,rd) = (find(vs),find(vd))
+		if rs != rd:
+			parent[rs] = rd
+	sizes = {}
+	for vertex in vertices:
+		root = find(vertex)
+		sizes[root] = sizes.get(root,0) + 1
+	largest = max(sizes,key=sizes.get)
+	return [vertex for vertex in vertices if find(vertex) == largest]
+
+############################################################
+# Runs every benchmark on one track and returns a dict of
+# metric name to value. Times are in seconds, memory in bytes.
+############################################################
+def bench_track(kind,n,queries,rng,incremental_max=20000):
+	(vertices,pairs) = TRACKS[kind](n,rng)
+	result = {"vertices": len(vertices),"edges": len(pairs)}
+
+	(result["construct_s"],graph) = timed(lambda: build(vertices,pairs))
+	if n <= incremental_max:
+		(result["construct_incremental_s"],_) = timed(lambda: build_incremental(vertices,pairs))
+
+	# Memory peak is measured on a separate build, since
+	# tracemalloc slows allocation down
+	tracemalloc.start()
+	build(vertices,pairs)
+	result["construct_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+
+	component = largest_component(vertices,pairs)
+	result["component_vertices"] = len(component)
+	sources = [rng.choice(component) for _ in range(queries)]
+	dests = [rng.choice(component) for _ in range(queries)]
+
+	(elapsed,_) = timed(lambda: [graph.djkstra(source) for source in sources])
+	result["djkstra_s"] = elapsed / queries
+	(elapsed,_) = timed(lambda: [graph.lcp(s,d) for (s,d) in zip(sources,dests)])
+	result["lcp_s"] = elapsed / queries
+	(elapsed,_) = timed(lambda: [graph.lcp(s,d,astar=True) for (s,d) in zip(sources,dests)])
+	result["lcp_astar_s"] = elapsed / queries
+
+	(result["compile_s"],compact) = timed(graph.compile)
+	(elapsed,_) = timed(lambda: [compact.lcp(s,d) for (s,d) in zip(sources,dests)])
+	result["compact_lcp_s"] = elapsed / queries
+
+	points = [(rng.uniform(0,math.sqrt(n)),rng.uniform(0,math.sqrt(n))) for _ in range(queries)]
+	(elapsed,_) = timed(lambda: [graph.nearest(point) for point in points])
+	result["nearest_s"] = elapsed / queries
+	return result
+
+############################################################
+# Prints the ratio of every timing and memory metric to the
+# baseline and returns the list of metrics that are slower
+# (or bigger) than the baseline by more than tolerance.
+############################################################
+def compare(results,baseline,tolerance):
+	regressions = []
+	for (key,metrics) in sorted(results.items()):
+		if key not in baseline["results"]:
+			print("%-20s no baseline" % key)
+			continue
+		for (metric,value) in sorted(metrics.items()):
+			old = baseline["results"][key].get(metric)
+			if (not (metric.endswith("_s") or metric.endswith("_bytes")) or not old):
+				continue
+			ratio = value / old
+			flag = ""
+			if ratio > 1 + tolerance:
+				flag = "  REGRESSION"
+				regressions.append("%s %s" % (key,metric))
+			print("%-20s %-22s %12.6g -> %12.6g  x%.2f%s" % (key,metric,old,value,ratio,flag))
+	return regressions
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Benchmark Bigraph construction and path queries.")
+	parser.add_argument("--sizes",type=int,nargs="+",default=[1000,10000,100000],help="approximate number of checkpoints per track")
+	parser.add_argument("--kinds",nargs="+",choices=sorted(TRACKS),default=sorted(TRACKS),help="track kinds to generate")
+	parser.add_argument("--queries",type=int,default=20,help="number of queries timed per benchmark")
+	parser.add_argument("--seed",type=int,default=0,help="random seed for tracks and queries")
+	parser.add_argument("--output",help="JSON file to write the results to")
+	parser.add_argument("--baseline",help="JSON results of an earlier run to compare against")
+	parser.add_argument("--tolerance",type=float,default=0.10,help="relative slowdown reported as a regression")
+	parser.add_argument("--incremental-max",type=int,default=20000,help="largest size whose per-call construction is timed")
+	args = parser.parse_args()
+
+	results = {}
+	for kind in args.kinds:
+		for n in args.sizes:
+			key = "%s-%d" % (kind,n)
+			print("running %s" % key)
+			results[key] = bench_track(kind,n,args.queries,random.Random(args.seed),args.incremental_max)
+			print(json.dumps(results[key],sort_keys=True))
+
+	report = {
+		"python": platform.python_version(),
+		"machine": platform.machine(),
+		"queries": args.queries,
+		"seed": args.seed,
+		"results": results,
+	}
+	if args.output:
+		with open(args.output,"w") as out:
+			json.dump(report,out,indent=2,sort_keys=True)
+
+	if args.baseline:
+		with open(args.baseline) as file:
+			baseline = json.load(file)
+		regressions = compare(results,baseline,args.tolerance)
+		if regressions:
+			print("%d regression(s) over %.0f%%" % (len(regressions),args.tolerance * 100))
+			raise SystemExit(1)
@@ -0,0 +1,212 @@
+############################################################
+# File: kdtree.py
+# Path: python_utils/
+# Author: Nathaniel Lao (lao.nathan95@gmail.com)
+#
+# Defines a 2-dimensional k-d tree for nearest point queries.
+#
+# Points can be inserted one at a time, so the index is kept
+# as a forest of perfectly balanced static trees whose sizes
+# are distinct powers of two (the "logarithmic method"). An
+# insertion merges the trees of the smaller sizes into a new
+# one, like carrying in a binary counter, so no tree ever
+# degenerates no matter the insertion order. Insertions cost
+# O(log^2 n) amortized and queries visit O(log n) trees.
+#
+# Each point is stored with an item (any object), which is
+# what the queries return.
+############################################################
+
+import heapq
+import math
+
+class Kdtree:
+	def __init__(self):
+		self.forest = []
+		self.size = 0
+
+	def __len__(self):
+		return self.size
+
+	########################################################
+	# Inserts a point (a 2-tuple) with its associated item.
+	########################################################
+	def insert(self,point,item):
+		carry = [(point[0],point[1],item)]
+		i = 0
+		while (i < len(self.forest) and self.forest[i] != None):
+			carry += self.forest[i].entries()
+			self.forest[i] = None
+			i += 1
+		if i == len(self.forest):
+			self.forest.append(None)
+		self.forest[i] = _StaticKdtree(carry)
+		self.size += 1
+
+	########################################################
+	# Inserts every (point, item) pair of an iterable. The
+	# batch is added to the size like a binary addition: only
+	# the trees of the bits that change (up to the highest
+	# one) are merged with the batch and rebuilt, and the
+	# larger trees are kept as they are.
+	########################################################
+	def extend(self,pairs):
+		entries = [(point[0],point[1],item) for (point,item) in pairs]
+		if not entries:
+			return
+		new_size = self.size + len(entries)
+		# Highest bit that differs between the old and new size
+		top = (self.size ^ new_size).bit_length() - 1
+		for i in range(min(top + 1,len(self.forest))):
+			if self.forest[i] != None:
+				entries += self.forest[i].entries()
+				self.forest[i] = None
+		while len(self.forest) < new_size.bit_length():
+			self.forest.append(None)
+
+		# The merged entries are exactly the low bits of the
+		# new size, so they split into one tree per set bit
+		start = 0
+		for i in range(top + 1):
+			if (new_size >> i) & 1:
+				self.forest[i] = _StaticKdtree(entries[start:start + (1 << i)])
+				start += 1 << i
+		self.size = new_size
+
+	########################################################
+	# Returns the (item, distance) pair of the point closest
+	# to the given point, or None if the tree is empty.
+	########################################################
+	def nearest(self,point):
+		found = self.k_nearest(point,1)
+		return found[0] if found else None
+
+	########################################################
+	# Returns the (item, distance) pairs of the k points
+	# closest to the given point, closest first.
+	########################################################
+	def k_nearest(self,point,k):
+		if k <= 0:
+			return []
+
+		# Max-heap (by negated squared distance) of the best k
+		# candidates found so far, shared by all the trees so
+		# that each tree is pruned with the best bound yet
+		best = []
+		for tree in self.forest:
+			if tree != None:
+				tree.search(point,k,best)
+		best.sort(reverse=True)
+		return [(item,math.sqrt(-neg_dsq)) for (neg_dsq,_,_,item) in best]
+
+	########################################################
+	# Returns the (item, distance) pairs of every point within
+	# distance r of the given point, closest first.
+	########################################################
+	def within_radius(self,point,r):
+		found = []
+		for tree in self.forest:
+			if tree != None:
+				tree.collect(point,r * r,found)
+		found.sort()
+		return [(item,math.sqrt(dsq)) for (dsq,_,_,item) in found]
+
+############################################################
+# Perfectly balanced, immutable k-d tree stored implicitly in
+# flat lists: the node of a range [lo,hi) is the median at
+# (lo+hi)//2, its left subtree is [lo,mid) and its right
+# subtree is [mid+1,hi). Nodes at even depth split on x and
+# nodes at odd depth split on y. All traversals use an explicit
+# stack.
+############################################################
+class _StaticKdtree:
+	def __init__(self,entries):
+		entries = list(entries)
+		stack = [(0,len(entries),0)]
+		while stack:
+			(lo,hi,depth) = stack.pop()
+			if hi - lo <= 1:
+				continue
+			axis = depth & 1
+			entries[lo:hi] = sorted(entries[lo:hi],key=lambda entry: entry[axis])
+			mid = (lo + hi) // 2
+			stack.append((lo,mid,depth + 1))
+			stack.append((mid + 1,hi,depth + 1))
+
+		self.xs = [entry[0] for entry in entries]
+		self.ys = [entry[1] for entry in entries]
+		self.items = [entry[2] for entry in entries]
+
+	########################################################
+	# Returns the (x, y, item) entries of the tree.
+	########################################################
+	def entries(self):
+		return list(zip(self.xs,self.ys,self.items))
+
+	########################################################
+	# Adds the k nearest entries of this tree to the shared
+	# best heap (see Kdtree.k_nearest). Heap entries are
+	# (negated squared distance, tree id, position, item) so
+	# that items are never compared.
+	########################################################
+	def search(self,point,k,best):
+		(qx,qy) = point
+		xs = self.xs
+		ys = self.ys
+
+		# Stack entries are (lo, hi, depth, lower bound of the
+		# squared distance to any point in the range)
+		stack = [(0,len(xs),0,0.0)]
+		while stack:
+			(lo,hi,depth,bound) = stack.pop()
+			if (lo >= hi or (len(best) == k and bound >= -best[0][0])):
+				continue
+
+			mid = (lo + hi) // 2
+			dx = qx - xs[mid]
+			dy = qy - ys[mid]
+			dsq = dx * dx + dy * dy
+			if len(best) < k:
+				heapq.heappush(best,(-dsq,id(self),mid,self.items[mid]))
+			elif dsq < -best[0][0]:
+				heapq.heapreplace(best,(-dsq,id(self),mid,self.items[mid]))
+
+			# Visit the side of the splitting plane containing
+			# the point first (it is pushed last)
+			diff = dx if (depth & 1) == 0 else dy
+			if diff < 0:
+				(near,far) = ((lo,mid),(mid + 1,hi))
+			else:
+				(near,far) = ((mid + 1,hi),(lo,mid))
+			stack.append((far[0],far[1],depth + 1,max(bound,diff * diff)))
+			stack.append((near[0],near[1],depth + 1,bound))
+
+	########################################################
+	# Appends (squared distance, tree id, position, item)
+	# for every entry of this tree within squared distance
+	# rsq of the point.
+	########################################################
+	def collect(self,point,rsq,found):
+		(qx,qy) = point
+		xs = self.xs
+		ys = self.ys
+
+		stack = [(0,len(xs),0)]
+		while stack:
+			(lo,hi,depth) = stack.pop()
+			if lo >= hi:
+				continue
+
+			mid = (lo + hi) // 2
+			dx = qx - xs[mid]
+			dy = qy - ys[mid]
+			dsq = dx * dx + dy * dy
+			if dsq <= rsq:
+				found.append((dsq,id(self),mid,self.items[mid]))
+
+			# Only cross the splitting plane if the circle does
+			diff = dx if (depth & 1) == 0 else dy
+			if (diff < 0 or diff * diff <= rsq):
+				stack.append((lo,mid,depth + 1))
+			if (diff >= 0 or diff * diff <= rsq):
+				stack.append((mid + 1,hi,depth + 1))
@@ -3,14 +3,42 @@
 # The csv's have a tendency to be corrupt and add newlines
 # Usage:
 #        newline.py <INPUT_FILE> <OUTPUT_FILE>
+#
+# Can also be imported to repair lines on the fly, for example in front of
+# the requirements importer:
+#        csv.reader(newline.repairLines(open(filename)))
 
 
 import sys
 import os.path
+import re
 
 # List of strings that every appropriate line should have
 IDENTIFIERS = ["user_","fun_","nonfun_","sys_","sw_"]
 
+# Matches any of the IDENTIFIERS at the start of a line, and only there
+LEADING = re.compile("|".join(re.escape(identifier) for identifier in IDENTIFIERS))
+
+# Takes an iterable of (possibly broken) lines and yields the repaired lines,
+# each ending with a newline. Every line is stripped from leading and trailing
+# whitespace and joined to the previous one, unless it starts with one of the
+# IDENTIFIERS. Only the line being repaired is held in memory.
+def repairLines(lines):
+	current = ""
+	for line in lines:
+		line = line.strip()
+		if (LEADING.match(line)):
+			yield current + "\n"
+			current = line
+		else:
+			current += line
+	yield current + "\n"
+
+# Repairs the file at <inputFileName> into a new file at <outputFileName>
+def repairFile(inputFileName,outputFileName):
+	with open(inputFileName,'r') as inputFile, open(outputFileName,'x') as outputFile:
+		outputFile.writelines(repairLines(inputFile))
+
 if __name__ == "__main__":
 	print("running csv newline checker")
 
@@ -31,39 +59,4 @@ if __name__ == "__main__":
 	if (os.path.isfile(outputFileName)):
 		os.remove(outputFileName)
 
-	inputFile = open(inputFileName,'r')
-	outputFile = open(outputFileName,'x')
-
-	# Create an empty result string
-	result = ""
-	current = ""
-
-	# Go through each line
-	for line in inputFile:
-		
-		# Strip each line from trailing and leading newlines and whitespace
-		current = line
-		current = current.strip()
-
-		# Find the leading lines
-		isLeading = False
-		for identifier in IDENTIFIERS:
-			if (current.find(identifier) == 0):
-				isLeading = True
-
-		# If the line starts with one of the identifiers, add a newline before it
-		if (isLeading):
-			result += "\n"
-
-		result += current
-
-	# Add additional newline at the end
-	result += "\n"
-
-	# Flush result string to the OUTPUT_FILE
-	outputFile.write(result)
-
-	# Cleanup
-	inputFile.close()
-	outputFile.close()
-
+	repairFile(inputFileName,outputFileName)
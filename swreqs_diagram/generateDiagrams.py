@@ -5,24 +5,166 @@
 #
 # Description:   Renders a diagram of SW requirements by importing CSV's and
 #                a generating PDFs of the the relationships between requirements
+#
+#                The requirements are split into one diagram per top-level
+#                requirement (its whole subtree) or per phase. Each diagram's
+#                graphviz source is fingerprinted and the fingerprints are kept
+#                in a cache file next to the diagrams, so graphviz only runs
+#                again for the diagrams whose requirements changed. Diagrams
+#                are rendered in parallel worker processes.
+#
+# Usage:         generateDiagrams.py [--output DIR] [--by subtree|phase]
+#                                    [--format FORMAT] [--processes N]
+#                                    [--repair] [--force] <CSV_FILE>
 ################################################################################
 
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os.path
+import re
 import graphviz
 import requirements
 
-'''
-import graphviz
+# Name of the fingerprint cache file, in the output directory
+CACHE_FILE = ".diagrams.json"
+
+# Ways of splitting the requirements into diagrams
+PARTITIONS = ["subtree","phase"]
+
+# Returns a dict of diagram name -> list of requirements
+# of <table> (a requirements.ReqTable), with one diagram
+# per top-level requirement and its descendants
+def partitionBySubtree(table):
+	parts = {}
+	for top in table.getTopLevel():
+		members = [top]
+		i = 0
+		while (i < len(members)):
+			members += members[i].children
+			i += 1
+		parts[top.id] = members
+	return parts
+
+# Returns a dict of diagram name -> list of requirements
+# of <table>, with one diagram per phase
+def partitionByPhase(table):
+	parts = {}
+	for req in table:
+		name = "no_phase" if req.phase == None else req.phase
+		parts.setdefault(name,[]).append(req)
+	return parts
+
+# Returns the graphviz source of the diagram of <reqs>.
+# Edges go from each parent to its children, for the
+# parents that are in the same diagram.
+def diagramSource(name,reqs):
+	dot = graphviz.Digraph(name=name,comment="requirements: %s" % name)
+	ids = set()
+	for req in reqs:
+		ids.add(req.id)
+		dot.node(req.id,"%s\n%s" % (req.id,req.description),shape="box")
+	for req in reqs:
+		if (req.parent != None and req.parent.id in ids):
+			dot.edge(req.parent.id,req.id)
+	return dot.source
+
+# Returns the sha256 of a diagram's <source> rendered
+# to <fmt>
+def fingerprint(source,fmt):
+	return hashlib.sha256(("%s\n%s" % (fmt,source)).encode("utf-8")).hexdigest()
+
+# Returns <name> made safe to use as a file name
+def fileName(name):
+	return re.sub(r"[^\w.-]","_",name)
+
+def loadCache(path):
+	if (not os.path.isfile(path)):
+		return {}
+	try:
+		with open(path) as cacheFile:
+			return json.load(cacheFile)
+	except (OSError,ValueError):
+		return {}
+
+def saveCache(path,cache):
+	with open(path,"w") as cacheFile:
+		json.dump(cache,cacheFile,indent=2,sort_keys=True)
+
+# Worker: renders the graphviz <source> to <outputPath>
+# (without the extension) in <fmt> and returns the path
+# of the rendered file
+def renderSource(source,outputPath,fmt):
+	return graphviz.Source(source).render(outputPath,format=fmt,cleanup=True)
+
+# Renders the diagrams of <table> into <outputDir>,
+# split <by> "subtree" or "phase", in <fmt> over
+# <processes> worker processes. Diagrams whose source
+# is unchanged since the last call are skipped unless
+# <force>. Returns a tuple of the (rendered,skipped)
+# lists of diagram names.
+def renderDiagrams(table,outputDir,by="subtree",fmt="pdf",processes=None,force=False):
+	if (by == "subtree"):
+		parts = partitionBySubtree(table)
+	elif (by == "phase"):
+		parts = partitionByPhase(table)
+	else:
+		raise ValueError("unknown partition: %s" % by)
+
+	os.makedirs(outputDir,exist_ok=True)
+	cachePath = os.path.join(outputDir,CACHE_FILE)
+	cache = loadCache(cachePath)
 
-dot = graphviz.Digraph(comment='The round Table')
+	# A diagram's new fingerprint is only recorded once it
+	# rendered, so pending and failed diagrams keep their
+	# old entry and are rendered again next time
+	jobs = {}
+	newCache = dict(cache)
+	skipped = []
+	for (name,reqs) in parts.items():
+		source = diagramSource(name,reqs)
+		outputPath = os.path.join(outputDir,"%s-%s" % (by,fileName(name)))
+		digest = fingerprint(source,fmt)
+		if (not force and cache.get(outputPath) == digest and os.path.isfile("%s.%s" % (outputPath,fmt))):
+			skipped += [name]
+		else:
+			jobs[name] = (source,outputPath,digest)
 
-dot.node('A', 'King Arthur')
-dot.node('B','Sir Bedevere the Wise')
-dot.node('L','Sir Lancelot the Brave')
+	rendered = []
+	failures = []
+	if (len(jobs) > 0):
+		with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+			futures = {}
+			for (name,(source,outputPath,digest)) in jobs.items():
+				futures[executor.submit(renderSource,source,outputPath,fmt)] = (name,outputPath,digest)
+			for future in concurrent.futures.as_completed(futures):
+				(name,outputPath,digest) = futures[future]
+				try:
+					future.result()
+				except Exception as error:
+					failures += ["%s: %s" % (name,error)]
+					continue
+				newCache[outputPath] = digest
+				rendered += [name]
 
-dot.edges(['AB','AL'])
-dot.edge('B','L',constraint='false')
+	saveCache(cachePath,newCache)
+	if (len(failures) > 0):
+		raise RuntimeError("%d diagram(s) failed to render:\n%s" % (len(failures),"\n".join(failures)))
+	return (rendered,skipped)
 
-print(dot.source)
+if __name__ == "__main__":
+	argParser = argparse.ArgumentParser(description="Render requirement diagrams from a requirements CSV.")
+	argParser.add_argument("csvFile",metavar="CSV_FILE",help="requirements csv, laid out as config.headers")
+	argParser.add_argument("--output",default="diagrams",help="directory of the rendered diagrams")
+	argParser.add_argument("--by",choices=PARTITIONS,default="subtree",help="one diagram per top-level requirement or per phase")
+	argParser.add_argument("--format",default="pdf",help="graphviz output format")
+	argParser.add_argument("--processes",type=int,help="number of rendering processes (default: one per CPU)")
+	argParser.add_argument("--repair",action="store_true",help="join broken csv lines first (see csv_cleanup/newline.py)")
+	argParser.add_argument("--force",action="store_true",help="render every diagram even if it did not change")
+	args = argParser.parse_args()
 
-dot.render('test-output/round-table.gv', view=False)
-'''
\ No newline at end of file
+	table = requirements.importCSV(args.csvFile,args.repair)
+	print("imported %d requirements" % len(table))
+	(rendered,skipped) = renderDiagrams(table,args.output,args.by,args.format,args.processes,args.force)
+	print("rendered %d diagrams, %d unchanged" % (len(rendered),len(skipped)))
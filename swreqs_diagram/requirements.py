@@ -10,6 +10,8 @@
 import config
 import os.path
 import csv
+import itertools
+from csv_cleanup import newline
 # Defines a requirement
 class Req:
 	def __init__(self,id, description):
@@ -20,6 +22,10 @@ class Req:
 		# This must be set by a method
 		self.parent = None
 		
+		# Requirements whose parent is this one, kept
+		# by setParent
+		self.children = []
+		
 		# This is inherited by parent.
 		# If at top, use specialized methods
 		self.phase	= None
@@ -30,9 +36,13 @@ class Req:
 		# - comment
 		# - num
 		
-		# Not implemented yet (TBD)
-		# - test_procedure
-		# - test_id
+		# Id of the parent as given in the CSV, kept
+		# even if no such requirement exists
+		self.parent_id = None
+		
+		# Tests that verify the requirement, if any
+		self.test_procedure = None
+		self.test_id = None
 		
 	def __str__(self):
 		output = ""
@@ -43,6 +53,11 @@ class Req:
 		output += "parent_description: %s\n" % self.parent_description
 		return output
 	
+	# Phases and parent descriptions are kept up to
+	# date as parents and phases are set, so these only
+	# re-propagate the subtree of this requirement.
+	# Both return the list of (req, old phase) of the
+	# requirements whose phase changed.
 	def setParent(self,parent):
 		# Hardcoding typechecking because explicit type on certain 
 		# instances do not work
@@ -50,41 +65,255 @@ class Req:
 			raise TypeError("requirement parent must be a requirement (Req)")
 		if (parent == self):
 			raise ValueError("a requirement cannot be a parent of itself")
+		# Only a requirement with its own subtree can
+		# close a cycle, so attaching a leaf does not walk
+		# up the parents
+		if (len(self.children) > 0):
+			for ancestor in parent.ancestors():
+				if (ancestor is self):
+					raise ValueError("%s is a descendant of %s, it cannot be its parent" % (parent.id,self.id))
+		if (self.parent != None):
+			self.parent.children.remove(self)
 		self.parent = parent
-		self.inherit()
+		self.parent_id = parent.id
+		parent.children.append(self)
+		return self.propagate()
 	
 	def setPhase(self,phase, force=False):
 		# If there is already a parent requirement,
 		# do not override the requirement, unless
 		# <force>
 		if (self.parent != None and not force):
-			self.inherit()
-		else:
+			return self.propagate()
+		changes = []
+		if (self.phase != phase):
+			changes += [(self,self.phase)]
 			self.phase = phase
+		return changes + self.propagateChildren()
+	
+	# Yields the parent, grandparent, ... up to the
+	# top-level requirement. Raises ValueError if the
+	# parents loop.
+	def ancestors(self):
+		seen = set()
+		node = self.parent
+		while (node != None):
+			if (node.id in seen):
+				raise ValueError("requirement cycle through %s" % node.id)
+			seen.add(node.id)
+			yield node
+			node = node.parent
 	
-	# Recursive call that retrieves
-	# the phase and description of the
-	# parent and sets it to the child
-	# (current object). Halts when there
-	# are no parent
+	# Retrieves the phase and description of the
+	# parent and sets it to the child (current
+	# object). The parent is kept up to date by
+	# setParent and setPhase, so there is no need to
+	# walk up to the top-level requirement.
 	def inherit(self):
 		if (self.parent != None):
-			self.parent.inherit()
 			self.phase = self.parent.phase
 			self.parent_description = self.parent.description
+	
+	# Sets the phase and parent description of this
+	# requirement from its parent, then of all its
+	# descendants
+	def propagate(self):
+		changes = []
+		if (self.parent != None):
+			if (self.phase != self.parent.phase):
+				changes += [(self,self.phase)]
+				self.phase = self.parent.phase
+			self.parent_description = self.parent.description
+		return changes + self.propagateChildren()
+	
+	# Sets the phase and parent description of all the
+	# descendants, breadth first from this requirement
+	def propagateChildren(self):
+		changes = []
+		queue = list(self.children)
+		i = 0
+		while (i < len(queue)):
+			req = queue[i]
+			i += 1
+			if (req.phase != req.parent.phase):
+				changes += [(req,req.phase)]
+				req.phase = req.parent.phase
+			req.parent_description = req.parent.description
+			queue += req.children
+		return changes
+
+
+# Table of requirements, indexed by id, by parent and by phase
+class ReqTable:
+	def __init__(self):
+		# id -> Req
+		self.reqs = {}
+		
+		# phase -> {id -> Req}, in load order. Children
+		# are indexed by each Req's children list.
+		self.phases = {}
+	
+	def __len__(self):
+		return len(self.reqs)
+	
+	def __iter__(self):
+		return iter(self.reqs.values())
+	
+	def __contains__(self,id):
+		return id in self.reqs
+	
+	def __getitem__(self,id):
+		return self.reqs[id]
+	
+	# Returns the requirement with <id>, or None
+	def get(self,id):
+		return self.reqs.get(id)
+	
+	# Returns the list of the child requirements of <id>
+	def getChildren(self,id):
+		req = self.reqs.get(id)
+		return [] if req == None else req.children
+	
+	# Returns the list of top-level requirements
+	def getTopLevel(self):
+		return [req for req in self.reqs.values() if req.parent == None]
+	
+	# Returns the list of requirements in <phase>
+	def getPhase(self,phase):
+		return list(self.phases.get(phase,{}).values())
+	
+	# Sets the parent of the requirement <id> to <parentId>
+	# and updates the phases of its subtree
+	def setParent(self,id,parentId):
+		self.reindex(self.reqs[id].setParent(self.reqs[parentId]))
+	
+	# Sets the phase of the requirement <id>, see Req.setPhase
+	def setPhase(self,id,phase,force=False):
+		self.reindex(self.reqs[id].setPhase(phase,force))
+	
+	# Moves the requirements of <changes>, a list of
+	# (req, old phase), to their new phase in the index
+	def reindex(self,changes):
+		for (req,oldPhase) in changes:
+			members = self.phases[oldPhase]
+			del members[req.id]
+			if (len(members) == 0):
+				del self.phases[oldPhase]
+			self.phases.setdefault(req.phase,{})[req.id] = req
+	
+	# Adds <req> to the table. Its parent is only looked
+	# up by resolve, so requirements can be added in any
+	# order.
+	def add(self,req):
+		if (req.id in self.reqs):
+			raise ValueError("duplicate requirement id %s" % req.id)
+		self.reqs[req.id] = req
+	
+	# Loads the requirements from csv <rows> (lists of
+	# strings) laid out as config.headers, then resolves
+	# the parents. The first row is used as the header row
+	# if it contains an "id" column, otherwise the columns
+	# are assumed to be in the order of config.headers.
+	# Empty rows and rows without an id are skipped.
+	def load(self,rows):
+		rows = iter(rows)
+		first = next(rows,None)
+		if (first is None):
+			return
+		if ("id" in first):
+			headers = first
+		else:
+			headers = config.headers
+			rows = itertools.chain([first],rows)
 		
+		# Column of every header of config.headers, None if
+		# the csv does not have it
+		column = {}
+		for name in config.headers:
+			column[name] = headers.index(name) if name in headers else None
+		if (column["id"] is None or column["description"] is None):
+			raise Exception("the csv must have an id and a description column")
+		
+		def field(row,name):
+			idx = column[name]
+			if (idx is None or idx >= len(row)):
+				return None
+			value = row[idx].strip()
+			return value if value != "" else None
+		
+		for row in rows:
+			id = field(row,"id")
+			if (id == None):
+				continue
+			# Rows of broken csvs can end early
+			description = field(row,"description")
+			req = Req(id,"" if description == None else description)
+			req.parent_id = field(row,"parent")
+			req.phase = field(row,"phase")
+			req.test_procedure = field(row,"test_procedure")
+			req.test_id = field(row,"test_id")
+			self.add(req)
+		
+		self.resolve()
+	
+	# Links every requirement to its parent in one pass
+	# over the table, then propagates the phases. A
+	# requirement whose parent id is not in the table is
+	# kept as top-level, with its parent_id.
+	def resolve(self):
+		for req in self.reqs.values():
+			req.children = []
+		for req in self.reqs.values():
+			parent = None if req.parent_id == None else self.reqs.get(req.parent_id)
+			if (parent is req):
+				raise ValueError("a requirement cannot be a parent of itself")
+			req.parent = parent
+			if (parent != None):
+				parent.children.append(req)
+		self.propagate()
+	
+	# Sets the phase and parent description of every
+	# requirement in one breadth first pass from the
+	# top-level requirements, so every parent is done
+	# before its children, and rebuilds the phase index.
+	# Raises ValueError if some parents loop, since
+	# those requirements are never reached.
+	def propagate(self):
+		order = self.getTopLevel()
+		for req in order:
+			req.parent_description = None
+		i = 0
+		while (i < len(order)):
+			parent = order[i]
+			i += 1
+			for req in parent.children:
+				req.phase = parent.phase
+				req.parent_description = parent.description
+			order += parent.children
+		
+		if (len(order) < len(self.reqs)):
+			reached = set(req.id for req in order)
+			looped = [id for id in self.reqs if id not in reached]
+			raise ValueError("requirement cycle between %s" % ", ".join(looped))
+		
+		self.phases = {}
+		for req in self.reqs.values():
+			self.phases.setdefault(req.phase,{})[req.id] = req
 
-# TODO
 # imports the given <filename> and returns a ReqTable
 # object representation
-def importCSV(filename):
+# If <repair>, broken lines are joined back on the fly
+# (see csv_cleanup/newline.py)
+def importCSV(filename, repair=False):
 	if (not(os.path.isfile(filename))):
 		raise Exception("%s is not a file" % filename)
 	
-	inputFile = csv.reader(open(filename))
-
-	for row in inputFile:
-		print(row) #DEBUGGING
+	table = ReqTable()
+	with open(filename,newline="") as lines:
+		if (repair):
+			lines = newline.repairLines(lines)
+		table.load(csv.reader(lines))
+	return table
 
 	
 # MAIN TEST DRIVER
@@ -96,5 +325,6 @@ if __name__ == "__main__":
 	print(r)
 
 
-	importCSV("sw.csv")
+	table = importCSV("sw.csv")
+	print("%d requirements, %d top-level" % (len(table),len(table.getTopLevel())))
 
@@ -0,0 +1,154 @@
+################################################################################
+# File:          traceability.py
+# Author:        Nate Lao (lao.nathan@yahoo.com)
+#
+# Description:   Traceability queries over a requirements.ReqTable: which
+#                requirements descend from a requirement, which top-level
+#                requirement one traces to, which have no test_id, ...
+#
+#                A TraceIndex numbers the requirements in depth first order
+#                (an Euler tour), so the descendants of a requirement are a
+#                contiguous range of that order. Ancestor checks, subtree
+#                sizes and top-level lookups are then O(1), and counting the
+#                untested requirements of a subtree is O(log N). The index is
+#                a snapshot: build a new one after changing parents.
+#
+# Usage:         traceability.py [--repair] <CSV_FILE> descendants <ID>
+#                traceability.py [--repair] <CSV_FILE> ancestors <ID>
+#                traceability.py [--repair] <CSV_FILE> top <ID>
+#                traceability.py [--repair] <CSV_FILE> size <ID>
+#                traceability.py [--repair] <CSV_FILE> untested [ID]
+#                traceability.py [--repair] <CSV_FILE> orphans
+################################################################################
+
+import argparse
+import bisect
+import requirements
+
+class TraceIndex:
+	def __init__(self,table):
+		self.table = table
+
+		# Requirements in depth first order
+		self.order = []
+
+		# id -> position in order when the requirement is
+		# entered (tin) and just past its last descendant
+		# (tout), so its subtree is order[tin:tout]
+		self.tin = {}
+		self.tout = {}
+
+		# id -> depth (0 for top-level) and id of the
+		# top-level requirement it traces to
+		self.depth = {}
+		self.root = {}
+
+		# Iterative depth first search, so deep hierarchies
+		# do not hit the recursion limit. A requirement is
+		# pushed again as an exit marker after its children.
+		for top in table.getTopLevel():
+			stack = [(top,False)]
+			while (len(stack) > 0):
+				(req,exiting) = stack.pop()
+				if (exiting):
+					self.tout[req.id] = len(self.order)
+					continue
+				self.tin[req.id] = len(self.order)
+				self.order.append(req)
+				self.depth[req.id] = 0 if req.parent == None else self.depth[req.parent.id] + 1
+				self.root[req.id] = top.id
+				stack.append((req,True))
+				for child in reversed(req.children):
+					stack.append((child,False))
+
+		if (len(self.order) < len(table)):
+			raise ValueError("requirement cycle: %d requirements are not under a top-level requirement" % (len(table) - len(self.order)))
+
+		# Positions of the untested requirements, in order
+		self.untestedPositions = [i for (i,req) in enumerate(self.order) if req.test_id == None]
+
+		# Requirements whose parent id is not in the table,
+		# in order
+		self.orphanList = [req for req in self.order if req.parent == None and req.parent_id != None]
+
+	# Returns True if <ancestorId> is <id> or one of its
+	# ancestors
+	def isAncestor(self,ancestorId,id):
+		return self.tin[ancestorId] <= self.tin[id] and self.tout[id] <= self.tout[ancestorId]
+
+	# Returns the list of the ancestors of <id>, from its
+	# parent up to the top-level requirement
+	def ancestors(self,id):
+		return list(self.table[id].ancestors())
+
+	# Returns the list of the descendants of <id> (not
+	# including itself), in depth first order
+	def descendants(self,id):
+		return self.order[self.tin[id] + 1:self.tout[id]]
+
+	# Returns the number of requirements in the subtree
+	# of <id>, itself included
+	def subtreeSize(self,id):
+		return self.tout[id] - self.tin[id]
+
+	# Returns the top-level requirement that <id> traces to
+	def topLevel(self,id):
+		return self.table[self.root[id]]
+
+	# Returns the list of the requirements without a
+	# test_id, in the subtree of <id> or in the whole table
+	def untested(self,id=None):
+		return [self.order[i] for i in self.untestedRange(id)]
+
+	# Returns the number of requirements without a test_id,
+	# in the subtree of <id> or in the whole table
+	def countUntested(self,id=None):
+		return len(self.untestedRange(id))
+
+	def untestedRange(self,id):
+		if (id == None):
+			return self.untestedPositions
+		start = bisect.bisect_left(self.untestedPositions,self.tin[id])
+		end = bisect.bisect_left(self.untestedPositions,self.tout[id])
+		return self.untestedPositions[start:end]
+
+	# Returns the list of the requirements whose parent id
+	# is not in the table
+	def orphans(self):
+		return list(self.orphanList)
+
+if __name__ == "__main__":
+	argParser = argparse.ArgumentParser(description="Traceability queries over a requirements CSV.")
+	argParser.add_argument("csvFile",metavar="CSV_FILE",help="requirements csv, laid out as config.headers")
+	argParser.add_argument("--repair",action="store_true",help="join broken csv lines first (see csv_cleanup/newline.py)")
+	queries = argParser.add_subparsers(dest="query",required=True)
+	queries.add_parser("descendants",help="requirements that descend from ID").add_argument("id",metavar="ID")
+	queries.add_parser("ancestors",help="requirements that ID descends from").add_argument("id",metavar="ID")
+	queries.add_parser("top",help="top-level requirement that ID traces to").add_argument("id",metavar="ID")
+	queries.add_parser("size",help="number of requirements in the subtree of ID").add_argument("id",metavar="ID")
+	queries.add_parser("untested",help="requirements without a test_id, under ID if given").add_argument("id",metavar="ID",nargs="?")
+	queries.add_parser("orphans",help="requirements whose parent is not in the csv")
+	args = argParser.parse_args()
+
+	index = TraceIndex(requirements.importCSV(args.csvFile,args.repair))
+	id = getattr(args,"id",None)
+	if (id != None and id not in index.table):
+		argParser.error("no requirement %s" % id)
+
+	if (args.query == "descendants"):
+		results = index.descendants(id)
+	elif (args.query == "ancestors"):
+		results = index.ancestors(id)
+	elif (args.query == "top"):
+		results = [index.topLevel(id)]
+	elif (args.query == "size"):
+		results = None
+		print(index.subtreeSize(id))
+	elif (args.query == "untested"):
+		results = index.untested(id)
+	else:
+		results = index.orphans()
+
+	if (results != None):
+		for req in results:
+			print(req.id)